@@ -0,0 +1,210 @@
+"""
+Many minesweeper games of the same size at once, held in stacked arrays (games x width x height).
+
+Generating the fields, opening cells (including the flood fill around opened 0s), the trivial rules of
+Minesweeper.open_trivials() and checking for won and lost games all work on the whole stack with numpy operations.
+To let the solvers play, game(i) returns a Minesweeper instance that works directly on the arrays of game i.
+
+    batch = MinesweeperBatch(10000, 30, 16, 99, rng=np.random.default_rng(0))
+    batch.open(np.full(10000, 2), np.full(10000, 2))
+    batch.open_trivials()
+    won = play(batch, ProbabilitySolver)
+"""
+
+import numpy as np
+
+from minesweeper import Minesweeper, neighbour_sum, EXPLORED, MARKED
+from patterns import open_patterns
+from solver_base import apply_batch
+
+
+class MinesweeperBatch:
+    """A batch of minesweeper games of the same size and number of mines."""
+
+    def __init__(self, games, width, height, mines, rng=None):
+        self.games = games
+        self.width = width
+        self.height = height
+        self.mines = mines
+        self.rng = rng if rng is not None else np.random.default_rng()  # random generator used to place the mines of all games
+
+        assert mines < width * height, 'cannot set more mines than number of cells in total'
+
+        shape = (games, width, height)
+        self.field = None  # generated on the first opening, so the first cell of every game is not a bomb
+        self.state = np.zeros(shape, dtype=np.int8)  # EXPLORED and MARKED flags of every cell, as in Minesweeper
+        self.visible = np.full(shape, -2, dtype=np.int8)  # the visible fields, see Minesweeper.get_visible_field()
+
+    def generate_fields(self, start_xs, start_ys):
+        """Generates the fields of all games at once, without any bombs at the start position of a game and its surrounding."""
+        games, width, height = self.state.shape
+        x = np.arange(width)[None, :, None]
+        y = np.arange(height)[None, None, :]
+
+        start_area = (np.abs(x - np.asarray(start_xs)[:, None, None]) <= 1) & (np.abs(y - np.asarray(start_ys)[:, None, None]) <= 1)
+
+        # every game places its mines on the cells with the smallest random keys
+        # (cells of the start area only get a mine if there are not enough other cells)
+        keys = self.rng.random((games, width * height)) + start_area.reshape(games, -1)
+        positions = np.argpartition(keys, self.mines - 1, axis=1)[:, :self.mines]
+
+        mines = np.zeros((games, width * height), dtype=bool)
+        mines[np.arange(games)[:, None], positions] = True
+        mines = mines.reshape(games, width, height)
+
+        # every other cell holds the number of neighbouring mines
+        self.field = np.where(mines, -1, neighbour_sum(mines)).astype(np.int8)
+
+    def open(self, xs, ys, active=None):
+        """
+            Opens one cell (xs[i], ys[i]) in every game i (only in the active ones, if a boolean mask is given).
+            Returns for every game whether a bomb was hit.
+        """
+        if self.field is None:
+            self.generate_fields(xs, ys)
+
+        games = np.arange(self.games) if active is None else np.flatnonzero(active)
+
+        to_open = np.zeros((len(games), self.width, self.height), dtype=bool)
+        to_open[np.arange(len(games)), np.asarray(xs)[games], np.asarray(ys)[games]] = True
+
+        exploded = np.zeros(self.games, dtype=bool)
+        exploded[games] = self._open_cells(games, to_open)
+
+        return exploded
+
+    def _open_cells(self, games, to_open):
+        """
+            Opens all cells of the given mask (one layer per given game). Every cell around an opened 0 gets opened as well,
+            until the whole region is opened. Returns for every given game whether a bomb was hit.
+        """
+        state = self.state[games]
+        field = self.field[games]
+
+        exploded = np.zeros(len(games), dtype=bool)
+        current = to_open & (state & EXPLORED == 0)
+
+        # breadth-first search, expanding the current layer of all games at once
+        while current.any():
+            state[current] |= EXPLORED
+            exploded |= (current & (field == -1)).any(axis=(1, 2))
+
+            current = (neighbour_sum(current & (field == 0)) > 0) & (state & EXPLORED == 0)
+
+        self.state[games] = state
+        self._update_visible(games)
+
+        return exploded
+
+    def _mark_cells(self, games, to_mark):
+        """Marks all cells of the given mask (one layer per given game) as bombs."""
+        state = self.state[games]
+        state[to_mark] |= MARKED
+
+        self.state[games] = state
+        self._update_visible(games)
+
+    def _update_visible(self, games):
+        # in place, so the games handed out by game() see the change
+        state = self.state[games]
+        self.visible[games] = np.where(state & MARKED, -3, np.where(state & EXPLORED, self.field[games], -2))
+
+    def open_trivials(self, active=None):
+        """Applies the trivial rules of Minesweeper.open_trivials() to all games (or the active ones) until nothing changes."""
+        games = np.flatnonzero(self.ongoing() if active is None else active)
+
+        # only the games that changed in the last round are looked at again
+        while len(games) > 0:
+            visible = self.visible[games]
+
+            numbers = visible >= 0
+            unknowns = visible == -2
+
+            # count neighbouring bomb/unknown cells of all cells of all games at once
+            number_of_bombs = neighbour_sum((visible == -3) | (visible == -1))
+            number_of_unknowns = neighbour_sum(unknowns)
+
+            satisfied = numbers & (number_of_bombs >= visible)
+            saturated = numbers & (visible >= number_of_unknowns + number_of_bombs)
+
+            to_open = unknowns & (neighbour_sum(satisfied) > 0)
+            to_mark = unknowns & (neighbour_sum(saturated) > 0) & ~to_open
+
+            opening = to_open.any(axis=(1, 2))
+            marking = to_mark.any(axis=(1, 2))
+
+            if opening.any():
+                self._open_cells(games[opening], to_open[opening])
+            if marking.any():
+                self._mark_cells(games[marking], to_mark[marking])
+
+            games = games[opening | marking]
+
+    def lost(self):
+        """Returns for every game whether a bomb was opened."""
+        return ((self.state & EXPLORED != 0) & (self.field == -1)).any(axis=(1, 2))
+
+    def won(self):
+        """Returns for every game whether all cells without a bomb have been opened."""
+        opened = ((self.state & EXPLORED != 0) & (self.field != -1)).sum(axis=(1, 2))
+
+        return opened == self.width * self.height - self.mines
+
+    def ongoing(self):
+        """Returns for every game whether it is neither won nor lost yet."""
+        if self.field is None:
+            return np.ones(self.games, dtype=bool)
+
+        return ~self.lost() & ~self.won()
+
+    def percentage_done(self):
+        """Returns for every game the share of the cells without a bomb that have been opened."""
+        return (self.state & EXPLORED != 0).sum(axis=(1, 2)) / (self.width * self.height - self.mines)
+
+    def game(self, i):
+        """
+            Returns game i as a Minesweeper instance that works on the arrays of the batch, so any solver can play it.
+            Its counters and frontier are computed from the arrays when it is created, so after changing the batch
+            as a whole, get the game again.
+        """
+        assert self.field is not None, 'the fields are generated on the first opening'
+
+        explored = self.state[i] & EXPLORED != 0
+
+        game = Minesweeper.__new__(Minesweeper)
+        game.__setstate__({
+            'width': self.width,
+            'height': self.height,
+            'mines': self.mines,
+            'rng': self.rng,
+            'field': self.field[i],
+            'state': self.state[i],
+            'visible': self.visible[i],
+            'open_counter': int(explored.sum()),
+            'marked_counter': int((self.state[i] & MARKED != 0).sum()),
+            'exploded_counter': int((explored & (self.field[i] == -1)).sum()),
+            'trivial_counter': 0,
+            'pattern_counter': 0,
+        })
+        game._rebuild_frontier()
+
+        return game
+
+
+def play(batch, solver_class, **solver_args):
+    """
+        Plays every ongoing game of the batch to its end with its own solver, applying all cells proven by a solve at once.
+        Returns for every game whether it was won.
+    """
+    for i in np.flatnonzero(batch.ongoing()):
+        game = batch.game(i)
+        solver = solver_class(game, **solver_args)
+
+        while not game.is_done():
+            if apply_batch(game, solver.solve_batch()):
+                break
+
+            game.open_trivials()
+            open_patterns(game)
+
+    return batch.won()
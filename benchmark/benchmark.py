@@ -2,75 +2,309 @@ import argparse
 import time
 import random
 import logging
-import pickle
-import codecs
+import traceback
+import multiprocessing
+import multiprocessing.connection
 import numpy as np
 
+import os
 import sys
 sys.path.insert(0, '.')
+sys.path.insert(0, 'benchmark')
 
 from minesweeper import Minesweeper
+import component_cache
+from patterns import open_patterns
+from solver_base import apply_batch
+from profiling import Profiler, NULL_PROFILER
+from traces import Trace
+import registry
 
-from solver_clingo import ClingoSolver
-from solver_clingo_grouped import ClingoSolverGrouped
-from solver_csp import CSPSolver
-from solver_csp_grouped import CSPSolverGrouped
+import results
 
+# the board every benchmark game is played on (width, height, mines)
+BOARD = (30, 16, 99)
 
-def get_seeded_instance(seed):
-    np.random.seed(seed)
-    m = Minesweeper(30, 16, 99)
-    m.open(4,4)
+# the solvers benchmarked by default, by their registry names
+SOLVERS = ['clingo', 'clingo-grouped', 'csp', 'csp-grouped']
+
+# the boards of a sweep: every size (width, height) with every density (share of cells holding a mine)
+SWEEP_SIZES = [(9, 9), (16, 16), (30, 16), (50, 50), (100, 100), (200, 200), (300, 300)]
+SWEEP_DENSITIES = [0.12, 0.16, 0.2]
+
+# the time limit of a sweep game on boards up to the size of BOARD, bigger boards get proportionally more time,
+# up to the maximum (otherwise a game on 300x300 could take more than an hour and a half before timing out)
+SWEEP_TIMEOUT = 30
+SWEEP_MAX_TIMEOUT = 300
+
+
+def get_seeded_instance(seed, board=BOARD, trace=None):
+    """
+        Returns the game of the given seed on the given board (width, height, mines), with its first cell opened.
+        The opening is recorded in the given trace (see traces.Trace), if any.
+    """
+    width, height, mines = board
+    start = (min(4, width - 1), min(4, height - 1))
+
+    m = Minesweeper(width, height, mines, rng=np.random.default_rng(seed))
+    m.open(*start)
+
+    if trace is not None:
+        trace.open(*start)
 
     return m
 
-def solve(solver):
+def solve(solver, profiler=None, trace=None, patterns=True):
+    """
+        Plays the game of the solver to its end, opening the cells decided by patterns after every step (if patterns is set).
+        If a profiler is given, it records every step (see profiling.Profiler).
+        If a trace is given, every solver call and everything done to the game is recorded in it (see traces.Trace).
+    """
     start_time = time.time()
     steps_done = 0
 
+    if profiler is not None:
+        solver.profile = profiler
+    profile = solver.profile
+
     while True:
-        best_action = solver.solve_step()
-        
-        if solver.game.open(*best_action):
-            break
-        
-        steps_done += 1
+        if profiler is not None:
+            profiler.start_step()
+
+        # apply all cells proven by a single solve before solving again
+        safe, mines, guess = batch = solver.solve_batch()
+
+        if trace is not None:
+            trace.solve()
+            trace.batch(batch)
+
+        with profile.phase('apply'):
+            lost = apply_batch(solver.game, batch)
+
+        if not lost:
+            steps_done += 1
+
+            with profile.phase('trivial'):
+                solver.game.open_trivials()
+
+            if trace is not None:
+                trace.trivial()
 
-        solver.game.open_trivials()
+            if patterns:
+                with profile.phase('patterns'):
+                    open_patterns(solver.game)
 
-        if solver.game.is_done():
+                if trace is not None:
+                    trace.patterns()
+
+        if profiler is not None:
+            profiler.end_step(safe=len(safe), mines=len(mines), guess=len(safe) == 0, lost=bool(lost))
+
+        if lost or solver.game.is_done():
             break
 
     time_diff = time.time() - start_time
 
     return solver.game.is_done(), time_diff, steps_done, solver.game.percentage_done()
 
-def append_to_file(stats):
-    with open('benchmark/bench.log', 'a') as myfile:
-        pickled_b64 = codecs.encode(pickle.dumps(stats), 'base64').decode()
-        myfile.write(pickled_b64 + '\n')
+def run_job(job):
+    """
+        Plays the game given by the job's seed and board with the job's solver, with the job's time limit per step (None for no limit).
+        If the job names a profile file, every step of the game is appended to it. If it names a trace directory,
+        the trace of the game is written to it. Patterns are only used if the job says so.
+        Returns the result record (solver, seed, success, duration, steps, percentage, status).
+    """
+    solver, seed, step_budget, profile_file, board, trace_dir, patterns = job
+    start_time = time.time()
+
+    trace = Trace(seed, *board) if trace_dir is not None else None
+    g = get_seeded_instance(seed, board, trace)
+    profiler = Profiler(profile_file, solver=solver.__name__, seed=seed, board=list(board)) if profile_file is not None else None
+
+    try:
+        s = solver(g, step_budget=step_budget)
+        result = (solver.__name__, seed, *solve(s, profiler, trace, patterns), 'ok')
+
+        if trace is not None:
+            trace.save(os.path.join(trace_dir, f'{solver.__name__}-{board[0]}x{board[1]}-{board[2]}-{seed}.trace'))
+
+        return result
+    except Exception:
+        # record crashed runs instead of silently dropping them
+        traceback.print_exc()
+        return (solver.__name__, seed, False, time.time() - start_time, 0, g.percentage_done(), 'error')
+
+def _run_job_process(job, connection):
+    """
+        Entry point of a worker process: runs a single job and sends its result back to the parent,
+        together with the groups it added to the component cache and its cache hits and misses.
+    """
+    cache = component_cache.shared
+    cache.take_new()
+    hits, misses = cache.hits, cache.misses
+
+    result = run_job(job)
+
+    connection.send((result, cache.take_new(), cache.hits - hits, cache.misses - misses))
+    connection.close()
+
+def run_jobs(jobs, workers=1, timeout=None):
+    """
+        Runs all jobs and yields their result records in the order of the given jobs, no matter in which order they finish.
+        If more than one worker or a timeout (in seconds) is given, every job runs in its own process, at most `workers` at a time.
+        Processes exceeding the timeout get killed and their job is recorded as timed out.
+    """
+    if workers <= 1 and timeout is None:
+        for job in jobs:
+            yield run_job(job)
+        return
+
+    pending = list(enumerate(jobs))[::-1]
+    running = {}   # receiving end of the result pipe -> (job index, job, process, deadline)
+    finished = {}  # job index -> result record, for jobs that finished before all their predecessors
+    next_index = 0
+
+    while pending or running:
+        # keep all workers busy
+        while pending and len(running) < workers:
+            index, job = pending.pop()
+
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_run_job_process, args=(job, sender), daemon=True)
+            process.start()
+            sender.close()  # only the child writes, so the parent sees EOF if the child dies without a result
+
+            deadline = None if timeout is None else time.time() + timeout
+            running[receiver] = (index, job, process, deadline)
+
+        # wait until either a job finishes or the earliest deadline is reached
+        wait_time = None
+        if timeout is not None:
+            wait_time = max(0, min(deadline for _, _, _, deadline in running.values()) - time.time())
+
+        for receiver in multiprocessing.connection.wait(list(running), timeout=wait_time):
+            index, job, process, _ = running.pop(receiver)
+            solver, seed = job[:2]
+
+            try:
+                finished[index], entries, hits, misses = receiver.recv()
+
+                # later workers start out with everything solved so far
+                component_cache.shared.update(entries)
+                component_cache.shared.hits += hits
+                component_cache.shared.misses += misses
+            except EOFError:
+                # the worker died without sending a result (e.g. it crashed inside a native library)
+                finished[index] = (solver.__name__, seed, False, 0.0, 0, 0.0, 'error')
+
+            receiver.close()
+            process.join()
+
+        # kill every job that exceeded its deadline
+        now = time.time()
+        for receiver, (index, job, process, deadline) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                process.kill()
+                process.join()
+                receiver.close()
+                del running[receiver]
+
+                solver, seed = job[:2]
+                finished[index] = (solver.__name__, seed, False, timeout, 0, 0.0, 'timeout')
+
+        # hand out results in job order
+        while next_index in finished:
+            yield finished.pop(next_index)
+            next_index += 1
+
+def append_to_file(stats, file='benchmark/bench.bin', board=BOARD):
+    results.append_records(file, results.to_records([stats], *board))
+
+def sweep_boards(sizes=SWEEP_SIZES, densities=SWEEP_DENSITIES, timeout=SWEEP_TIMEOUT, max_timeout=SWEEP_MAX_TIMEOUT):
+    """
+        Returns the boards (width, height, mines) of a sweep, each with its time limit per game: the timeout, scaled with
+        the number of cells of boards bigger than BOARD, but at most max_timeout (or the timeout, if that is bigger).
+    """
+    boards = []
+
+    for width, height in sizes:
+        for density in densities:
+            # at least one mine, and enough free cells around the first opened cell
+            mines = min(max(1, round(density * width * height)), width * height - 9)
+            scaled = timeout * max(1.0, width * height / (BOARD[0] * BOARD[1]))
+            boards.append(((width, height, mines), min(scaled, max(timeout, max_timeout))))
+
+    return boards
+
+def _size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
 
 if __name__ == '__main__':
-    solvers = [ClingoSolver, ClingoSolverGrouped, CSPSolver, CSPSolverGrouped]
-    
+    parser = argparse.ArgumentParser(prog='python3 benchmark/benchmark.py', description='Benchmarks all solvers on randomly seeded minesweeper instances')
+    parser.add_argument('-e', '--epochs', help='The number of seeds to benchmark every solver on (per board when sweeping, default 1000 or 20 when sweeping)', type=int)
+    parser.add_argument('-j', '--workers', help='The number of games to run in parallel', type=int, default=1)
+    parser.add_argument('-t', '--timeout', help='Wall-clock time limit in seconds for a single game, after which it is recorded as timed out (when sweeping, for boards up to 30x16, scaled with the number of cells for bigger ones)', type=float)
+    parser.add_argument('--max-timeout', help=f'The most the scaled time limit of a sweep game may grow to, in seconds (default {SWEEP_MAX_TIMEOUT})', type=float, default=SWEEP_MAX_TIMEOUT)
+    parser.add_argument('-b', '--step-budget', help='Time limit in seconds for a single solving step, after which the solvers estimate the probabilities from the solutions found so far', type=float)
+    parser.add_argument('-s', '--seed', help='The seed of the first epoch (following epochs use the next seeds)', type=int)
+    parser.add_argument('-o', '--output', help='The file to write the benchmark results to (default benchmark/bench.bin, or benchmark/sweep.bin when sweeping)')
+    parser.add_argument('-a', '--append', help='If set, keep the results already in the output file and append to them', action='store_true')
+    parser.add_argument('-p', '--profile', help='A file to write the phase timings and backend statistics of every solving step to (as JSON lines)')
+    parser.add_argument('--no-patterns', help='If set, do not open/mark cells decided by local patterns of neighbouring numbers (as benchmarks before patterns did)', action='store_true')
+    parser.add_argument('--traces', help='A directory to write the trace of every game to (see traces.py)')
+    parser.add_argument('--sweep', help='If set, benchmark every solver over a grid of board sizes and mine densities instead of the 30x16 board', action='store_true')
+    parser.add_argument('--sizes', help='The board sizes of the sweep, as WIDTHxHEIGHT', nargs='+', type=_size, default=SWEEP_SIZES)
+    parser.add_argument('--densities', help='The mine densities of the sweep, as share of all cells', nargs='+', type=float, default=SWEEP_DENSITIES)
+    parser.add_argument('-c', '--cache', help='A file to load solved frontier groups from and store them in afterwards, so later runs can reuse them')
+
+    args = parser.parse_args()
+
+    # a sweep looks at where each approach stops being usable, so it covers every registered solver
+    if args.sweep:
+        solvers = [registry.get(name) for name in registry.names()]
+        boards = sweep_boards(args.sizes, args.densities, args.timeout if args.timeout is not None else SWEEP_TIMEOUT, args.max_timeout)
+        epochs = args.epochs if args.epochs is not None else 20
+        output = args.output if args.output is not None else 'benchmark/sweep.bin'
+    else:
+        solvers = [registry.get(name) for name in SOLVERS]
+        boards = [(BOARD, args.timeout)]
+        epochs = args.epochs if args.epochs is not None else 1000
+        output = args.output if args.output is not None else 'benchmark/bench.bin'
+
+    # draw all seeds up front, so the jobs are the same no matter how many workers run them
+    first_seed = int(time.time() * 1000) % (2**32 - 1) if args.seed is None else args.seed
+    seeds = [(first_seed + i) % (2**32 - 1) for i in range(epochs)]
+
+    if args.traces is not None:
+        os.makedirs(args.traces, exist_ok=True)
+
+    if args.cache is not None and os.path.exists(args.cache):
+        component_cache.shared.load(args.cache)
+
     # clear previous benchmarks
-    with open('benchmark/bench.log','w') as f:
-        f.write('')    
+    if not args.append:
+        results.clear(output)
 
+        if args.profile is not None and os.path.exists(args.profile):
+            os.remove(args.profile)
 
-    for i in range(1000):
-        print(f'--- EPOCH {i + 1} --- ')
-        seed = int(time.time() * 1000) % (2**32 - 1)
-        
-        for solver in solvers:
-            # print(f'Starting solver "{solver.__name__} with seed {seed}..."')
-            g = get_seeded_instance(seed)
-            s = solver(g)
+    for board, timeout in boards:
+        jobs = [(solver, seed, args.step_budget, args.profile, board, args.traces, not args.no_patterns) for seed in seeds for solver in solvers]
 
-            try:
-                result = (solver.__name__, seed, *solve(s))
-                append_to_file(result)
+        if args.sweep:
+            print(f'--- BOARD {board[0]}x{board[1]}, {board[2]} mines, timeout {timeout:.0f}s --- ')
+
+        for i, result in enumerate(run_jobs(jobs, workers=args.workers, timeout=timeout)):
+            if i % len(solvers) == 0:
+                print(f'--- EPOCH {i // len(solvers) + 1} --- ')
+
+            # results arrive in job order, other benchmark processes may append to the same file concurrently
+            append_to_file(result, output, board)
+
+            print(result)
+
+    if args.cache is not None:
+        component_cache.shared.save(args.cache)
 
-                print(result)
-            except:
-                print('caugt exception')
\ No newline at end of file
+    print('Component cache:', component_cache.shared.statistics())
@@ -1,77 +1,127 @@
 import time
 import random
 import logging
-import pickle
-import codecs
+import argparse
 from collections import defaultdict
 
 import numpy as np
 import matplotlib.pyplot as plt
 
+import os
+import sys
+sys.path.insert(0, 'benchmark')
 
-def load_runs(file):
-    with open(file, 'r') as myfile:
-        content = myfile.read()
-        runs = content.split('\n\n')
-        runs = list(filter(lambda r: r != '', runs))
+from results import RunStatistics, iter_chunks, STATUSES
 
-        runs = list(map(
-            lambda run: pickle.loads(codecs.decode(bytes(run, 'utf-8'), 'base64')),
-            runs
-        ))
+BIN_VALUES = [5**x for x in range(-2, 6)] #[10**x for x in range(-1, 5)]
 
-        grouped_by_seed = defaultdict(list)
-        for i, (solver, seed, success, duration, steps, percentage) in enumerate(runs):
-            grouped_by_seed[seed].append((solver, success, duration, steps, percentage))
 
-        grouped_by_solver = defaultdict(list)
-        for i, (solver, seed, success, duration, steps, percentage) in enumerate(runs):
-            grouped_by_solver[solver].append((seed, success, duration, steps, percentage))
+def summarize(chunks, bin_values=BIN_VALUES):
+    """Reads the given record chunks once and returns the run statistics of every solver in it."""
+    statistics = defaultdict(lambda: RunStatistics(bin_values))
 
-        return runs, grouped_by_seed, grouped_by_solver
+    for chunk in chunks:
+        for solver in np.unique(chunk['solver']):
+            statistics[solver.decode()].add(chunk[chunk['solver'] == solver])
 
-def get_bins(runs):
-    bin_values = [5**x for x in range(-2, 6)] #[10**x for x in range(-1, 5)]
+    return statistics
 
-    bins = defaultdict(int)
-    for value in bin_values:
-        bins[value] = 0
+def summarize_sweep(chunks):
+    """
+        Reads the given record chunks once and returns for every solver and board (width, height, mines) the array
+        [games, won games, duration of the finished games, steps of the finished games].
+    """
+    sweep = defaultdict(lambda: np.zeros(4))
 
-    for seed, success, duration, steps, percentage in runs:
-        if  percentage < 0.8:
-            continue
+    for chunk in chunks:
+        for solver in np.unique(chunk['solver']):
+            records = chunk[chunk['solver'] == solver]
+            finished = records['status'] == STATUSES.index('ok')
 
-        for value in bin_values:
-            if duration < value:
-                bins[value] += 1
-                break
+            boards = np.stack([records['width'], records['height'], records['mines']], axis=1).astype(np.int64)
+            unique, inverse = np.unique(boards, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
 
-    return bin_values, bins
+            for i, board in enumerate(unique):
+                selected = inverse == i
+                sweep[solver.decode(), tuple(int(value) for value in board)] += [
+                    selected.sum(),
+                    (records['success'] & selected).sum(),
+                    records['duration'][selected & finished].sum(),
+                    records['steps'][selected & finished].sum(),
+                ]
 
-def get_statistics(runs):
-    durs = [duration for seed, success, duration, steps, percentage in runs if percentage >= 0.8]
+    return sweep
 
-    min_val = min(durs)
-    max_val = min(durs)
+def plot_sweep(sweep, file='figures/solver-scaling'):
+    """Plots the success rate and the time per step of every solver over the number of cells, one curve per mine density."""
+    fig, (ax_success, ax_time) = plt.subplots(1, 2, figsize=(16, 6))
 
-    average = np.mean(durs)
-    median = np.median(durs)
-    std = np.std(durs)
+    solvers = sorted({solver for solver, _ in sweep})
+    densities = sorted({round(mines / (width * height), 2) for _, (width, height, mines) in sweep})
+    linestyles = ['-', '--', ':', '-.']
 
-    percentage_solved = sum([1 for seed, success, duration, steps, percentage in runs if percentage >= 0.8]) / len(runs)
+    for i, solver in enumerate(solvers):
+        for j, density in enumerate(densities):
+            boards = sorted((width * height, (width, height, mines)) for s, (width, height, mines) in sweep
+                            if s == solver and round(mines / (width * height), 2) == density)
+            if not boards:
+                continue
 
-    return min_val, max_val, average, median, std, percentage_solved
+            cells = [cell_count for cell_count, _ in boards]
+            games, won, duration, steps = np.array([sweep[solver, board] for _, board in boards]).T
+
+            style = dict(color=f'C{i}', linestyle=linestyles[j % len(linestyles)], marker='o', label=f'{solver} ({density:.0%} mines)')
+            ax_success.plot(cells, won / games * 100, **style)
+            # boards without a finished game have no time per step
+            ax_time.plot(cells, np.where(steps > 0, duration / np.maximum(steps, 1), np.nan), **style)
+
+    ax_success.set(xscale='log', xlabel='cells', ylabel='% won', title='Success rate')
+    ax_time.set(xscale='log', yscale='log', xlabel='cells', ylabel='seconds per step', title='Time per step (finished games)')
+    ax_time.legend(fontsize=8)
+
+    plt.savefig(file + '.pdf')
+    plt.savefig(file + '.png')
+    plt.close(fig)
+
+def get_bins(chunks, bin_values=BIN_VALUES):
+    stats = RunStatistics(bin_values)
+    for chunk in chunks:
+        stats.add(chunk)
+
+    return _bins(stats)
+
+def get_statistics(chunks):
+    stats = RunStatistics(BIN_VALUES)
+    for chunk in chunks:
+        stats.add(chunk)
+
+    return _statistics(stats)
+
+def _bins(stats):
+    return stats.bin_values, dict(zip(stats.bin_values, stats.bins.tolist()))
+
+def _statistics(stats):
+    percentage_solved = stats.solved / stats.runs
+
+    return stats.min, stats.max, stats.mean, stats.median(), stats.std(), percentage_solved
 
 
 
 if __name__ == '__main__':
-    runs, grouped_by_seed, grouped_by_solver = load_runs('benchmark/bench.log')
+    parser = argparse.ArgumentParser(prog='python3 benchmark/benchmark_interpret.py', description='Plots the results of a benchmark run')
+    parser.add_argument('-i', '--input', help='The benchmark result file to read', default='benchmark/bench.bin')
+    parser.add_argument('-s', '--sweep', help='The result file of a sweep over board sizes and densities, its curves are plotted if it exists', default='benchmark/sweep.bin')
+
+    args = parser.parse_args()
+
+    statistics = summarize(iter_chunks(args.input))
 
     fig, axs = plt.subplots(2, 2, figsize=(16, 10))
-    
+
     for i, solver in enumerate(['ClingoSolver', 'ClingoSolverGrouped', 'CSPSolver', 'CSPSolverGrouped']):
-        bin_values, bins = get_bins(grouped_by_solver[solver])
-        min_val, max_val, average, median, std, percentage_solved = get_statistics(grouped_by_solver[solver])
+        bin_values, bins = _bins(statistics[solver])
+        min_val, max_val, average, median, std, percentage_solved = _statistics(statistics[solver])
 
         ax = axs[i % 2, i // 2]
 
@@ -87,6 +137,9 @@ if __name__ == '__main__':
         ax.text(5, 160, 'Std.Dev.: {:.2f}s'.format(std), fontsize=12)
 
     plt.margins(x=0)
-    # plt.show() 
+    # plt.show()
     plt.savefig('figures/solver-comparison.pdf')
-    plt.savefig('figures/solver-comparison.png')
\ No newline at end of file
+    plt.savefig('figures/solver-comparison.png')
+
+    if os.path.exists(args.sweep):
+        plot_sweep(summarize_sweep(iter_chunks(args.sweep)))
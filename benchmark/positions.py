@@ -0,0 +1,104 @@
+"""
+Corpus of hard mid-game positions, to time the solvers on the positions that matter without playing whole games.
+
+Recording plays seeded games, replays their traces (see traces.py) and keeps every position the solver was called on
+that needed a guess or has a big frontier. Benchmarking restores every position and times a single solve_step().
+
+    python3 benchmark/positions.py record --epochs 100 --output benchmark/positions.bin
+    python3 benchmark/positions.py bench benchmark/positions.bin --repeat 3
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+import sys
+sys.path.insert(0, '.')
+sys.path.insert(0, 'benchmark')
+
+import component_cache
+import registry
+from traces import Trace, restore, save_positions, load_positions
+from benchmark import get_seeded_instance, solve
+
+
+def record(solver_class, seeds, board, min_frontier=16, trace_dir=None):
+    """
+        Plays the seeded games with the given solver and returns the snapshots of their hard positions: the ones the solver
+        had to guess on, or whose frontier has at least min_frontier closed cells. The traces are kept in trace_dir, if given.
+    """
+    hard = []
+
+    for seed in seeds:
+        trace = Trace(seed, *board)
+        solve(solver_class(get_seeded_instance(seed, board, trace)), trace=trace)
+
+        if trace_dir is not None:
+            trace.save(os.path.join(trace_dir, f'{solver_class.__name__}-{board[0]}x{board[1]}-{board[2]}-{seed}.trace'))
+
+        for snapshot, guessed in trace.positions():
+            if guessed or len(restore(snapshot).frontier_closed) >= min_frontier:
+                hard.append(snapshot)
+
+    return hard
+
+def bench(solver_class, snapshots, repeat=1):
+    """Returns the time solve_step() of the given solver takes on every position (the fastest of repeat runs)."""
+    times = np.full(len(snapshots), np.inf)
+
+    for i, snapshot in enumerate(snapshots):
+        for _ in range(repeat):
+            # every run solves the groups of the position again
+            component_cache.shared = component_cache.ComponentCache()
+            solver = solver_class(restore(snapshot))
+
+            start_time = time.perf_counter()
+            solver.solve_step()
+            times[i] = min(times[i], time.perf_counter() - start_time)
+
+    return times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python3 benchmark/positions.py', description='Records a corpus of hard mid-game positions and times the solvers on it')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='Play seeded games and keep their hard positions')
+    record_parser.add_argument('-e', '--epochs', help='The number of seeds to play', type=int, default=100)
+    record_parser.add_argument('-s', '--seed', help='The seed of the first game (following games use the next seeds)', type=int, default=0)
+    record_parser.add_argument('-w', '--width', help='The width of the boards', type=int, default=30)
+    record_parser.add_argument('-he', '--height', help='The height of the boards', type=int, default=16)
+    record_parser.add_argument('-b', '--bombs', help='The number of bombs of the boards', type=int, default=99)
+    record_parser.add_argument('--solver', help='The solver playing the games', choices=registry.names(), default='probability')
+    record_parser.add_argument('--min-frontier', help='The number of closed frontier cells from which on a position counts as hard', type=int, default=16)
+    record_parser.add_argument('--traces', help='A directory to keep the trace of every game in')
+    record_parser.add_argument('-o', '--output', help='The position file to write', default='benchmark/positions.bin')
+
+    bench_parser = commands.add_parser('bench', help='Time a solve_step() of the solvers on every position of a position file')
+    bench_parser.add_argument('positions', help='The position file to read')
+    bench_parser.add_argument('--solvers', help='The solvers to time (all registered solvers by default)', nargs='+', choices=registry.names(), default=registry.names())
+    bench_parser.add_argument('-r', '--repeat', help='How often to solve every position, the fastest run counts', type=int, default=1)
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        if args.traces is not None:
+            os.makedirs(args.traces, exist_ok=True)
+
+        seeds = [args.seed + i for i in range(args.epochs)]
+        hard = record(registry.get(args.solver), seeds, (args.width, args.height, args.bombs), args.min_frontier, args.traces)
+        save_positions(args.output, hard)
+
+        print(f'--- {len(hard)} hard positions of {len(seeds)} games written to {args.output} ---')
+        exit()
+
+    snapshots = load_positions(args.positions)
+    print(f'--- {len(snapshots)} positions ---')
+
+    for name in args.solvers:
+        times = bench(registry.get(name), snapshots, args.repeat)
+
+        print(f'{name}: total {times.sum():.3f}s, median {np.median(times) * 1000:.2f}ms, '
+              f'p90 {np.percentile(times, 90) * 1000:.2f}ms, max {times.max() * 1000:.2f}ms')
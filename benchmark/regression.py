@@ -0,0 +1,416 @@
+"""
+Performance regression suite: plays a fixed corpus of seeded games with every solver and compares the timings against
+a stored baseline, so changes to the game or the solvers can be checked for slowdowns before they ship.
+
+The corpus (benchmark/corpus.json) lists the boards and seeds to play, it carries a version that has to be raised
+whenever its games change, as only measurements of the same corpus version can be compared. For every solver, the
+latency percentiles of whole games and of single steps, the number of solver calls (steps), the backend counters
+(see profiling.py) and the wins are recorded.
+
+    python3 benchmark/regression.py record     # measure and store the baseline
+    python3 benchmark/regression.py compare    # measure again and flag slowdowns against the baseline
+
+    git worktree add ../baseline HEAD~1
+    python3 benchmark/regression.py compare --against ../baseline --repeat 5    # measure both trees in turns
+
+Timings of a stored baseline were taken at another time, under another load of the machine. With --against, the
+baseline is measured again from a checkout of its commit: a process per tree plays the games, alternating game by game,
+so drifts of the machine hit both sides alike. Every round over the corpus starts fresh processes.
+
+The unit of comparison is the game: its time is the median over all runs of the corpus, the steps of a game are not
+independent samples and are not tested. As the games are seeded, every game has a counterpart in the baseline, so the
+times are compared in pairs (one-sided Wilcoxon signed-rank test on their ratios), without counterparts as a whole
+(one-sided Mann-Whitney U test). A slowdown is only flagged if it is significant and the median of the ratios of the
+games (the effect size) grew by more than the threshold. A different number of wins or solver calls means the solver
+plays differently, which is reported as well.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+import sys
+sys.path.insert(0, '.')
+sys.path.insert(0, 'benchmark')
+
+import component_cache
+import registry
+from profiling import Profiler
+from benchmark import get_seeded_instance, solve
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def load_corpus(file):
+    with open(file) as f:
+        return json.load(f)
+
+def percentiles(samples):
+    """Returns the percentiles (and the maximum) of the samples, keyed by their name."""
+    if len(samples) == 0:
+        return {}
+
+    values = np.percentile(samples, PERCENTILES)
+    result = {f'p{p}': float(value) for p, value in zip(PERCENTILES, values)}
+    result['max'] = float(np.max(samples))
+
+    return result
+
+def warm_up(solver_class, corpus, step_budget=None):
+    """Plays the first game of the corpus without measuring it, it pays for lazy imports and tables built on first use."""
+    board = corpus['boards'][0]
+    game = get_seeded_instance(board['seeds'][0], (board['width'], board['height'], board['mines']))
+    solve(solver_class(game, step_budget=step_budget))
+
+def play(solver_class, board, seed, step_budget=None):
+    """Plays the game of the given seed on the given board of the corpus, returns (game, step times, backend counters)."""
+    game = get_seeded_instance(seed, (board['width'], board['height'], board['mines']))
+    profiler = Profiler()
+
+    won, duration, steps, percentage = solve(solver_class(game, step_budget=step_budget), profiler)
+    counters = {}
+
+    for step in profiler.steps:
+        for name, value in step['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+
+    game = {'board': board['name'], 'seed': seed, 'won': bool(won), 'time': duration, 'steps': steps, 'percentage': percentage}
+
+    return game, [step['time'] for step in profiler.steps], counters
+
+def corpus_games(corpus):
+    """Returns the games of the corpus as (board index, seed)."""
+    return [(i, seed) for i, board in enumerate(corpus['boards']) for seed in board['seeds']]
+
+def measure(solver_name, corpus, step_budget=None, repeat=1):
+    """Plays every game of the corpus (repeat times) with the given solver and returns its measurement."""
+    solver_class = registry.get(solver_name)
+    warm_up(solver_class, corpus, step_budget)
+
+    runs = []
+    step_times = []
+    counters = {}
+
+    for _ in range(repeat):
+        # every run starts without any solved groups, so it does not depend on what ran before
+        component_cache.shared = component_cache.ComponentCache()
+        games = []
+
+        for i, seed in corpus_games(corpus):
+            game, times, game_counters = play(solver_class, corpus['boards'][i], seed, step_budget)
+            games.append(game)
+            step_times += times
+
+            for name, value in game_counters.items():
+                counters[name] = counters.get(name, 0) + value
+
+        runs.append(games)
+
+    return summarize(runs, step_times, counters)
+
+def summarize(runs, step_times, counters):
+    """
+        Returns the measurement of the given runs over the corpus (lists of games in the same order): every game holds its
+        times of all runs and their median as its time, the outcome of the game is the one of the first run.
+    """
+    games = []
+
+    for plays in zip(*runs):
+        game = dict(plays[0])
+        game['times'] = [play['time'] for play in plays]
+        game['time'] = float(np.median(game['times']))
+        games.append(game)
+
+    wins = sum(game['won'] for game in games)
+
+    return {
+        'games': games,
+        'step_times': step_times,
+        'game_percentiles': percentiles([game['time'] for game in games]),
+        'step_percentiles': percentiles(step_times),
+        'solver_calls': sum(game['steps'] for game in games),
+        'counters': counters,
+        'wins': wins,
+        'win_rate': wins / len(games),
+    }
+
+def measure_all(solver_names, corpus, step_budget=None, repeat=1):
+    """Returns the measurements of all given solvers, together with what they were measured on."""
+    solvers = {}
+
+    for name in solver_names:
+        print(f'--- measuring {name} ---')
+        solvers[name] = measure(name, corpus, step_budget, repeat)
+        print(summary_line(name, solvers[name]))
+
+    return _measurements(solvers, corpus, step_budget)
+
+def _measurements(solvers, corpus, step_budget=None, tree=None):
+    """Returns the measurements of the solvers together with what they were measured on (the tree is the working directory by default)."""
+    return {
+        'corpus_version': corpus['version'],
+        'step_budget': step_budget,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': _git_commit(tree),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'solvers': solvers,
+    }
+
+def serve(corpus, step_budget=None):
+    """
+        Plays the games asked for on stdin (lines of JSON holding the solver, board index and seed) and answers each with
+        a line of JSON holding the result of play(). measure_interleaved() runs this in the tree to be measured.
+    """
+    # anything the solvers print must not get mixed up with the answers
+    answers = sys.stdout
+    sys.stdout = sys.stderr
+    solver_name = None
+
+    for line in sys.stdin:
+        request = json.loads(line)
+
+        if request['solver'] != solver_name:
+            solver_name = request['solver']
+            solver_class = registry.get(solver_name)
+            warm_up(solver_class, corpus, step_budget)
+
+            # every solver starts without any solved groups
+            component_cache.shared = component_cache.ComponentCache()
+
+        answers.write(json.dumps(play(solver_class, corpus['boards'][request['board']], request['seed'], step_budget)) + '\n')
+        answers.flush()
+
+def measure_interleaved(baseline_tree, solver_names, corpus_file, step_budget=None, repeat=1):
+    """
+        Measures the baseline tree (a checkout of the baseline commit) and this tree game by game in turns, in repeat
+        rounds over the corpus. Every round plays in a fresh process per tree, started with the same hash seed, and the
+        tree playing a game first alternates. Returns the measurements of (baseline, current).
+    """
+    corpus = load_corpus(corpus_file)
+    trees = {'baseline': os.path.abspath(baseline_tree), 'current': os.getcwd()}
+    sides = list(trees)
+
+    # the script imports the solvers from its working directory, so it plays the games of the tree it is run in
+    command = [sys.executable, os.path.abspath(__file__), 'serve', '--corpus', os.path.abspath(corpus_file)]
+    if step_budget is not None:
+        command += ['--step-budget', str(step_budget)]
+
+    runs = {(side, name): [] for side in sides for name in solver_names}
+    step_times = {(side, name): [] for side in sides for name in solver_names}
+    counters = {(side, name): {} for side in sides for name in solver_names}
+
+    for i in range(repeat):
+        print(f'--- round {i + 1}/{repeat} ---')
+        env = dict(os.environ, PYTHONHASHSEED=str(i))
+        workers = {side: subprocess.Popen(command, cwd=trees[side], env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) for side in sides}
+
+        try:
+            for name in solver_names:
+                games = {side: [] for side in sides}
+
+                for j, (board, seed) in enumerate(corpus_games(corpus)):
+                    for side in (sides if (i + j) % 2 == 0 else sides[::-1]):
+                        workers[side].stdin.write(json.dumps({'solver': name, 'board': board, 'seed': seed}) + '\n')
+                        workers[side].stdin.flush()
+
+                        answer = workers[side].stdout.readline()
+                        if not answer:
+                            raise RuntimeError(f'the {side} tree stopped playing ({trees[side]})')
+
+                        game, times, game_counters = json.loads(answer)
+                        games[side].append(game)
+                        step_times[side, name] += times
+
+                        for counter, value in game_counters.items():
+                            counters[side, name][counter] = counters[side, name].get(counter, 0) + value
+
+                for side in sides:
+                    runs[side, name].append(games[side])
+        finally:
+            for worker in workers.values():
+                worker.stdin.close()
+                worker.wait()
+
+    results = []
+
+    for side in sides:
+        solvers = {}
+
+        for name in solver_names:
+            solvers[name] = summarize(runs[side, name], step_times[side, name], counters[side, name])
+            print(summary_line(f'{name} ({side})', solvers[name]))
+
+        results.append(_measurements(solvers, corpus, step_budget, trees[side]))
+
+    return results
+
+def _git_commit(tree=None):
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=tree, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def summary_line(name, measurement):
+    games = measurement['game_percentiles']
+    steps = measurement['step_percentiles']
+
+    return (f'{name}: {measurement["wins"]}/{len(measurement["games"])} won, {measurement["solver_calls"]} solver calls, '
+            f'game p50 {games["p50"]:.3f}s p90 {games["p90"]:.3f}s, step p50 {steps["p50"] * 1000:.1f}ms p99 {steps["p99"] * 1000:.1f}ms')
+
+
+def _ranks(values):
+    """Returns the ranks of the values (ties get their average rank) and the sizes of the groups of ties."""
+    order = np.argsort(values, kind='mergesort')
+    _, first, counts = np.unique(values[order], return_index=True, return_counts=True)
+
+    ranks = np.empty(len(values))
+    ranks[order] = np.repeat(first + (counts + 1) / 2, counts)
+
+    return ranks, counts
+
+def mann_whitney_greater(current, baseline):
+    """
+        Returns the p-value of the one-sided Mann-Whitney U test that the current samples tend to be bigger than the
+        baseline samples (normal approximation with tie and continuity correction, fine for more than about 20 samples).
+    """
+    current = np.asarray(current, dtype=np.float64)
+    baseline = np.asarray(baseline, dtype=np.float64)
+    n1, n2 = len(current), len(baseline)
+
+    if n1 == 0 or n2 == 0:
+        return 1.0
+
+    ranks, ties = _ranks(np.concatenate([current, baseline]))
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - np.sum(ties ** 3 - ties) / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+def wilcoxon_greater(current, baseline):
+    """
+        Returns the p-value of the one-sided Wilcoxon signed-rank test that the current samples tend to be bigger than
+        their paired baseline samples, tested on the log ratios (normal approximation with tie and continuity correction).
+    """
+    differences = np.log(np.asarray(current, dtype=np.float64)) - np.log(np.asarray(baseline, dtype=np.float64))
+    differences = differences[differences != 0]
+    n = len(differences)
+
+    if n == 0:
+        return 1.0
+
+    ranks, ties = _ranks(np.abs(differences))
+    w = ranks[differences > 0].sum()
+
+    variance = n * (n + 1) * (2 * n + 1) / 24 - np.sum(ties ** 3 - ties) / 48
+    if variance <= 0:
+        return 1.0
+
+    z = (w - n * (n + 1) / 4 - 0.5) / math.sqrt(variance)
+
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+def compare(baseline, current, alpha=0.01, threshold=0.1):
+    """
+        Compares the game times of the current measurements with the baseline ones and prints a report.
+        Returns the list of (solver, metric) whose slowdown is significant and bigger than the threshold (as share).
+    """
+    assert baseline['corpus_version'] == current['corpus_version'], 'the baseline was measured on another version of the corpus'
+
+    regressions = []
+
+    for name, measurement in current['solvers'].items():
+        if name not in baseline['solvers']:
+            print(f'{name}: not in the baseline')
+            continue
+
+        base = baseline['solvers'][name]
+
+        # games pair up if both runs played the same games
+        paired = [(game['board'], game['seed']) for game in measurement['games']] == [(game['board'], game['seed']) for game in base['games']]
+
+        # the time of a game is its median over all runs, every game is one sample
+        samples = np.array([game['time'] for game in measurement['games']])
+        base_samples = np.array([game['time'] for game in base['games']])
+
+        # the effect size: the median growth of the games, or of the median game without pairs
+        ratio = np.median(samples / base_samples) if paired else np.median(samples) / np.median(base_samples)
+        p = wilcoxon_greater(samples, base_samples) if paired else mann_whitney_greater(samples, base_samples)
+        slower = p < alpha and ratio > 1 + threshold
+
+        if slower:
+            regressions.append((name, 'game'))
+
+        print(f'{name} game time: median {np.median(base_samples):.4f}s -> {np.median(samples):.4f}s, effect {(ratio - 1) * 100:+.1f}%, '
+              f'p = {p:.4f}{"" if paired else " (unpaired)"}{"  <-- SLOWER" if slower else ""}')
+
+        # the games are seeded, so these only change if the solver plays differently
+        if measurement['wins'] != base['wins'] or measurement['solver_calls'] != base['solver_calls']:
+            print(f'{name}: played differently, wins {base["wins"]} -> {measurement["wins"]}, '
+                  f'solver calls {base["solver_calls"]} -> {measurement["solver_calls"]}')
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python3 benchmark/regression.py', description='Measures the solvers on a fixed corpus of games and compares them against a stored baseline')
+    parser.add_argument('command', choices=['record', 'compare', 'serve'], help='record: store a new baseline, compare: flag slowdowns against the baseline, '
+                                                                            'serve: play the games asked for on stdin (used by compare --against)')
+    parser.add_argument('--corpus', help='The corpus of boards and seeds to play', default='benchmark/corpus.json')
+    parser.add_argument('--baseline', help='The baseline file to store or compare against', default='benchmark/baseline.json')
+    parser.add_argument('--solvers', help='The solvers to measure (all registered solvers by default)', nargs='+', choices=registry.names(), default=registry.names())
+    parser.add_argument('-b', '--step-budget', help='Time limit in seconds for a single solving step', type=float)
+    parser.add_argument('-r', '--repeat', help='How often to play the corpus, more runs give more reliable timings', type=int, default=1)
+    parser.add_argument('--against', help='A checkout of the baseline commit to measure in turns with this tree, instead of comparing against the stored baseline')
+    parser.add_argument('--alpha', help='Significance level of the test for slowdowns', type=float, default=0.01)
+    parser.add_argument('--threshold', help='Smallest median growth of the game times (as share) to be flagged as slowdown', type=float, default=0.1)
+    parser.add_argument('-o', '--output', help='A file to store the measurements of the compared run in (e.g. to use it as the next baseline)')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(load_corpus(args.corpus), args.step_budget)
+        exit()
+
+    if args.against is not None:
+        if args.command != 'compare':
+            parser.error('--against is only supported by compare')
+
+        baseline, measurements = measure_interleaved(args.against, args.solvers, args.corpus, args.step_budget, args.repeat)
+    else:
+        corpus = load_corpus(args.corpus)
+        measurements = measure_all(args.solvers, corpus, args.step_budget, args.repeat)
+
+        if args.command == 'record':
+            with open(args.baseline, 'w') as f:
+                json.dump(measurements, f)
+
+            print(f'--- baseline written to {args.baseline} ---')
+            exit()
+
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(measurements, f)
+
+    regressions = compare(baseline, measurements, args.alpha, args.threshold)
+
+    if regressions:
+        print(f'--- {len(regressions)} slowdown(s): {", ".join(f"{name} ({metric})" for name, metric in regressions)} ---')
+        exit(1)
+
+    print('--- no slowdowns ---')
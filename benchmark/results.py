@@ -0,0 +1,187 @@
+"""
+Compact on-disk store for benchmark results.
+
+A result file starts with a short header followed by fixed-width binary records of type RESULT_DTYPE.
+Records are only ever appended, each batch with a single write on a file opened in append mode, so several
+benchmark processes can add to the same file at once. A new file gets its header before it appears under its
+name, so no writer can append to a file without header. A file that does not hold whole records after its
+header (e.g. cut off by a killed writer) is rejected by the readers instead of being misread.
+"""
+
+import os
+import sys
+import pickle
+import codecs
+
+import numpy as np
+
+HEADER = b'MSBENCH\x01'
+
+STATUSES = ['ok', 'timeout', 'error']
+
+RESULT_DTYPE = np.dtype([
+    ('solver', 'S32'),
+    ('seed', '<u4'),
+    ('width', '<u2'),
+    ('height', '<u2'),
+    ('mines', '<u4'),
+    ('success', '?'),
+    ('status', 'u1'),
+    ('steps', '<u4'),
+    ('duration', '<f8'),
+    ('percentage', '<f8'),
+])
+
+
+def to_records(results, width, height, mines):
+    """Converts result tuples (solver, seed, success, duration, steps, percentage[, status]) into records."""
+    records = np.zeros(len(results), dtype=RESULT_DTYPE)
+
+    for i, result in enumerate(results):
+        solver, seed, success, duration, steps, percentage = result[:6]
+        status = result[6] if len(result) > 6 else 'ok'
+
+        records[i] = (solver.encode(), seed, width, height, mines, success, STATUSES.index(status), steps, duration, percentage)
+
+    return records
+
+def _header_file(file):
+    """Writes a file holding only the header next to the given file and returns its path."""
+    path = f'{file}.{os.getpid()}.{os.urandom(4).hex()}.tmp'
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        os.write(fd, HEADER)
+    finally:
+        os.close(fd)
+
+    return path
+
+def append_records(file, records):
+    """Appends the given records to the result file, creating the file (and writing its header) if needed."""
+    if not os.path.exists(file):
+        # the file appears with its header at once, linking fails if a concurrent writer created it first
+        path = _header_file(file)
+        try:
+            os.link(path, file)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(path)
+
+    fd = os.open(file, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, np.ascontiguousarray(records, dtype=RESULT_DTYPE).tobytes())
+    finally:
+        os.close(fd)
+
+def clear(file):
+    """Replaces the result file by an empty one."""
+    os.replace(_header_file(file), file)
+
+def iter_chunks(file, chunk_size=1 << 16):
+    """
+        Yields all complete records of the result file in chunks of at most chunk_size records.
+        The file is memory-mapped, so only the chunk currently looked at has to be in memory.
+    """
+    size = os.path.getsize(file)
+
+    with open(file, 'rb') as f:
+        assert f.read(len(HEADER)) == HEADER, f'"{file}" is not a benchmark result file'
+
+    count, rest = divmod(size - len(HEADER), RESULT_DTYPE.itemsize)
+    assert rest == 0, f'"{file}" does not hold whole records after its header, it may have been cut off'
+
+    if count == 0:
+        return
+
+    records = np.memmap(file, dtype=RESULT_DTYPE, mode='r', offset=len(HEADER), shape=(count,))
+
+    for start in range(0, count, chunk_size):
+        yield records[start:start + chunk_size]
+
+def select(chunks, solver):
+    """Filters the chunks to the records of the given solver."""
+    solver = solver.encode()
+
+    for chunk in chunks:
+        yield chunk[chunk['solver'] == solver]
+
+
+class RunStatistics:
+    """
+        Summarises runs in a single pass with bounded memory.
+        Only runs that opened at least `min_percentage` of the cells count as solved, and only their durations are
+        taken into account. The median is estimated from a fine logarithmic histogram of the durations.
+    """
+
+    # histogram used to estimate the median, 200 bins per decade between 0.1ms and 100000s
+    MEDIAN_EDGES = np.logspace(-4, 5, 9 * 200 + 1)
+
+    def __init__(self, bin_values, min_percentage=0.8):
+        self.bin_values = bin_values
+        self.min_percentage = min_percentage
+
+        self.runs = 0
+        self.solved = 0
+        self.bins = np.zeros(len(bin_values), dtype=np.int64)
+        self.median_histogram = np.zeros(len(self.MEDIAN_EDGES) + 1, dtype=np.int64)
+
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the mean
+
+    def add(self, chunk):
+        """Adds a chunk of records to the statistics."""
+        self.runs += len(chunk)
+
+        durations = np.asarray(chunk['duration'][chunk['percentage'] >= self.min_percentage], dtype=np.float64)
+        if len(durations) == 0:
+            return
+
+        # runs are put into the first bin whose value is bigger than their duration, longer runs are not counted
+        bin_index = np.searchsorted(self.bin_values, durations, side='right')
+        self.bins += np.bincount(bin_index, minlength=len(self.bin_values) + 1)[:len(self.bin_values)]
+        self.median_histogram += np.bincount(np.searchsorted(self.MEDIAN_EDGES, durations), minlength=len(self.median_histogram))
+
+        self.min = min(self.min, durations.min())
+        self.max = max(self.max, durations.max())
+
+        # merge mean and variance of the chunk with the running ones (Chan et al.)
+        count = self.solved + len(durations)
+        delta = durations.mean() - self.mean
+        self.m2 += np.sum((durations - durations.mean()) ** 2) + delta ** 2 * self.solved * len(durations) / count
+        self.mean += delta * len(durations) / count
+        self.solved = count
+
+    def median(self):
+        """Returns the estimated median duration of the solved runs (within half a histogram bin, about 0.6%)."""
+        index = np.searchsorted(np.cumsum(self.median_histogram), (self.solved + 1) / 2)
+        index = min(max(index, 1), len(self.MEDIAN_EDGES) - 1)
+
+        return np.sqrt(self.MEDIAN_EDGES[index - 1] * self.MEDIAN_EDGES[index])
+
+    def std(self):
+        return np.sqrt(self.m2 / self.solved) if self.solved > 0 else np.nan
+
+
+def load_legacy_log(file):
+    """Yields the result tuples of a log written by older benchmark versions (base64-encoded pickles)."""
+    with open(file, 'r') as myfile:
+        for run in myfile.read().split('\n\n'):
+            if run != '':
+                yield pickle.loads(codecs.decode(bytes(run, 'utf-8'), 'base64'))
+
+def convert_legacy_log(src, dst, width=30, height=16, mines=99):
+    """Converts a legacy log into a result file. Legacy logs did not store the board, it was always 30x16/99."""
+    clear(dst)
+    append_records(dst, to_records(list(load_legacy_log(src)), width, height, mines))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python3 benchmark/results.py LEGACY_LOG RESULT_FILE')
+        exit(1)
+
+    convert_legacy_log(sys.argv[1], sys.argv[2])
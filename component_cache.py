@@ -0,0 +1,173 @@
+"""
+Cache of solved frontier groups, shared by all solvers in a process (and optionally kept on disk between runs).
+
+A group is given by its numbers (each with the number of mines around it that are not marked yet) and its closed cells.
+Groups that only differ by translation, rotation or reflection have the same solutions, so they share a canonical key:
+the smallest of the 8 rotated/reflected layouts, each moved to the origin. The cached value holds the number of
+solutions and, for every closed cell in the canonical order, the number of solutions in which it is a mine.
+
+On disk, the entries are stored as JSON (the counts can exceed 64 bits) under a header naming the format and its version.
+Files of another format or version are ignored.
+"""
+
+import os
+import json
+from collections import OrderedDict
+
+FORMAT = 'minesweeper-component-cache'
+VERSION = 2
+
+# the rotations and reflections of the square
+SYMMETRIES = [
+    lambda x, y: (x, y),
+    lambda x, y: (-x, y),
+    lambda x, y: (x, -y),
+    lambda x, y: (-x, -y),
+    lambda x, y: (y, x),
+    lambda x, y: (-y, x),
+    lambda x, y: (y, -x),
+    lambda x, y: (-y, -x),
+]
+
+
+def canonical_form(numbers, closed, bound=None):
+    """
+        Returns (key, cells): the canonical key of the group and its closed cells in the order of the cached counts.
+        numbers: list of ((x, y), mines around the number that are not marked yet)
+        closed: the closed cells of the group
+        bound: the most mines the group may contain, only needed if it is smaller than the number of closed cells
+    """
+    best = None
+
+    for symmetry in SYMMETRIES:
+        moved_numbers = [(symmetry(*cell), value) for cell, value in numbers]
+        moved_closed = [(symmetry(*cell), cell) for cell in closed]
+
+        min_x = min(x for (x, _), _ in moved_numbers + moved_closed)
+        min_y = min(y for (_, y), _ in moved_numbers + moved_closed)
+
+        key_numbers = tuple(sorted(((x - min_x, y - min_y), value) for (x, y), value in moved_numbers))
+        ordered = sorted(((x - min_x, y - min_y), cell) for (x, y), cell in moved_closed)
+
+        key = (bound, key_numbers, tuple(position for position, _ in ordered))
+
+        if best is None or key < best[0]:
+            best = (key, [cell for _, cell in ordered])
+
+    return best
+
+def group_key(game, numbers, closed, bound=None):
+    """Returns the canonical form of a group of the given game, see canonical_form()."""
+    values = []
+    for x, y in numbers:
+        marked = sum(1 for cell in game._get_neighbours(x, y) if game.is_marked(*cell))
+        values.append(((x, y), int(game.field[x, y]) - marked))
+
+    # a bound of at least the number of closed cells can never be reached, so it does not distinguish groups
+    if bound is not None and bound >= len(closed):
+        bound = None
+
+    return canonical_form(values, closed, bound)
+
+
+class ComponentCache:
+    """
+        Bounded LRU cache from canonical group keys to (number of solutions, mines per closed cell).
+        Only exact results may be put into the cache.
+    """
+
+    def __init__(self, max_size=100000, file=None):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.new_entries = {}  # entries put since the last take_new()
+
+        self.hits = 0
+        self.misses = 0
+
+        if file is not None and os.path.exists(file):
+            self.load(file)
+
+    def get(self, key):
+        """Returns the cached value of the key (marking it as recently used), or None."""
+        value = self.entries.get(key)
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return value
+
+    def put(self, key, value):
+        self._put(key, value)
+        self.new_entries[key] = value
+
+    def _put(self, key, value):
+        if self.max_size <= 0:
+            return
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        # drop the least recently used entries
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def update(self, entries):
+        """Adds entries found somewhere else (e.g. by another process)."""
+        for key, value in entries.items():
+            self._put(key, value)
+
+    def take_new(self):
+        """Returns the entries put since the last call."""
+        new_entries = self.new_entries
+        self.new_entries = {}
+
+        return new_entries
+
+    def statistics(self):
+        lookups = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+            'size': len(self.entries),
+        }
+
+    def load(self, file):
+        """Adds the entries stored in the given file."""
+        try:
+            with open(file) as f:
+                data = json.load(f)
+        except ValueError:
+            return
+
+        if not isinstance(data, dict) or data.get('format') != FORMAT or data.get('version') != VERSION:
+            return
+
+        self.update(dict(_from_json(key, value) for key, value in data['entries']))
+
+    def save(self, file):
+        """Stores all entries in the given file (replacing it at once, so readers never see a partly written file)."""
+        with open(file + '.tmp', 'w') as f:
+            json.dump({'format': FORMAT, 'version': VERSION, 'entries': list(self.entries.items())}, f, separators=(',', ':'))
+
+        os.replace(file + '.tmp', file)
+
+
+def _from_json(key, value):
+    """Turns an entry read from JSON (where every tuple became a list) back into the key and value of the cache."""
+    bound, numbers, positions = key
+    model_count, counts = value
+
+    key = (None if bound is None else int(bound), tuple(((int(x), int(y)), int(mines)) for (x, y), mines in numbers),
+           tuple((int(x), int(y)) for x, y in positions))
+
+    return key, (int(model_count), tuple(int(count) for count in counts))
+
+
+# the cache used by the solvers unless they are given another one
+shared = ComponentCache()
@@ -0,0 +1,135 @@
+class DisjointSet:
+    """Union-find over hashable items, with path halving and union by size."""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        parent = self.parent
+
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+
+        return item
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+        return a
+
+    def sets(self):
+        """Returns a dict mapping every root to the list of items in its set."""
+        sets = {}
+        for item in self.parent:
+            sets.setdefault(self.find(item), []).append(item)
+
+        return sets
+
+
+class FrontierGrouping:
+    """
+        Splits the frontier of a game into independent groups: two frontier numbers belong to the same group if they
+        (transitively) share a closed neighbour, so the assignments of different groups do not influence each other.
+
+        The groups are kept between calls and only the ones that changed since the last call are computed again:
+        groups that lost a number or closed cell (because it got opened or marked) are split up again, new numbers are
+        joined with the groups they share closed cells with.
+    """
+
+    def __init__(self, game):
+        self.game = game
+
+        self.numbers = set()  # frontier numbers at the time of the last update
+        self.closed = set()  # frontier closed cells at the time of the last update
+
+        self.components = {}  # component id -> (set of numbers, set of closed cells)
+        self.component_of = {}  # number or closed cell -> id of the component it belongs to
+
+    def groups(self):
+        """
+            Returns the current groups as a list of (numbers, closed cells) pairs of sorted cell lists.
+            The groups are sorted by their first number, so the order is the same no matter how they were found.
+        """
+        self.update()
+
+        groups = [(sorted(numbers), sorted(closed)) for numbers, closed in self.components.values()]
+        groups.sort()
+
+        return groups
+
+    def update(self):
+        """Brings the groups up to date with the frontier of the game."""
+        numbers = set(self.game.frontier_numbers)
+        closed = set(self.game.frontier_closed)
+
+        added = numbers - self.numbers
+        removed = (self.numbers - numbers) | (self.closed - closed)
+
+        # every component that lost cells might fall apart, so its remaining numbers get grouped again
+        regroup = set(added)
+        for component in {self.component_of[cell] for cell in removed if cell in self.component_of}:
+            component_numbers, component_closed = self.components.pop(component)
+            regroup |= component_numbers & numbers
+
+            for cell in component_numbers | component_closed:
+                del self.component_of[cell]
+
+        if regroup:
+            self._group(regroup, closed)
+
+        self.numbers = numbers
+        self.closed = closed
+
+    def _group(self, regroup, frontier_closed):
+        """Groups the given numbers, joining them with the existing components they share closed cells with."""
+        sets = DisjointSet()
+        owner = {}  # closed cell -> a number it neighbours (for cells not in an existing component)
+        neighbours = {}
+
+        for number in regroup:
+            sets.add(number)
+            neighbours[number] = [cell for cell in self.game._get_neighbours(*number) if cell in frontier_closed]
+
+            for cell in neighbours[number]:
+                if cell in self.component_of:
+                    # existing components are represented by their id
+                    component = self.component_of[cell]
+                    sets.add(component)
+                    sets.union(number, component)
+                else:
+                    sets.union(number, owner.setdefault(cell, number))
+
+        for items in sets.sets().values():
+            component_numbers = set()
+            component_closed = set()
+
+            for item in items:
+                if item in neighbours:
+                    component_numbers.add(item)
+                    component_closed.update(neighbours[item])
+                else:
+                    merged_numbers, merged_closed = self.components.pop(item)
+                    component_numbers |= merged_numbers
+                    component_closed |= merged_closed
+
+            # any of its numbers is a unique id for the new component
+            component = min(component_numbers)
+            self.components[component] = (component_numbers, component_closed)
+
+            for cell in component_numbers | component_closed:
+                self.component_of[cell] = component
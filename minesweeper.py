@@ -1,22 +1,88 @@
 import random
 import numpy as np
 
+
+def neighbour_sum(grid):
+    """
+        Returns for every cell the sum of its (up to 8) neighbours, cells outside of the field count as 0.
+        Works on the last two axes, so a stack of fields can be given as well.
+    """
+    width, height = grid.shape[-2:]
+
+    padded = np.zeros(grid.shape[:-2] + (width + 2, height + 2), dtype=np.int8)
+    padded[..., 1:-1, 1:-1] = grid
+
+    # sum up the 3x3 block around every cell (separately along both axes) and remove the center cell again
+    rows = padded[..., :-2, :] + padded[..., 1:-1, :] + padded[..., 2:, :]
+    block = rows[..., :-2] + rows[..., 1:-1] + rows[..., 2:]
+
+    return block - padded[..., 1:-1, 1:-1]
+
+
+# the state of a cell is a combination of these flags (0 for a closed cell)
+EXPLORED = 1
+MARKED = 2
+
+
 class Minesweeper:
-    """A minesweeper game instance."""
+    """
+        A minesweeper game instance.
+        The state of all cells is kept in a single int8 grid of flags, next to the int8 field and the visible field,
+        which is updated in place on every change (so a game takes three bytes per cell).
+    """
 
-    def __init__(self, width, height, mines):
+    __slots__ = ('width', 'height', 'mines', 'rng', 'field', 'state', 'visible', 'visible_view',
+                 'open_counter', 'marked_counter', 'exploded_counter', 'trivial_counter', 'pattern_counter',
+                 'frontier_numbers', 'frontier_closed')
+
+    def __init__(self, width, height, mines, rng=None):
         self.width = width
         self.height = height
         self.mines = mines
+        self.rng = rng if rng is not None else np.random.default_rng()  # random generator used to place the mines
 
         self.field = None  # load the field on first opening, so we can ensure that the first cell is not a bomb
-        self.explored = np.zeros((width, height))
-        self.marked = np.zeros((width, height))
+        self.state = np.zeros((width, height), dtype=np.int8)  # EXPLORED and MARKED flags of every cell
+
+        # the visible field (see get_visible_field()) and a read-only view of it that is handed out
+        self.visible = np.full((width, height), -2, dtype=np.int8)
+        self.visible_view = self.visible.view()
+        self.visible_view.flags.writeable = False
 
         assert mines < width * height, 'cannot set more mines than number of cells in total'
 
-        self.open_counter = 0
+        self.open_counter = 0  # number of explored cells
+        self.marked_counter = 0  # number of marked cells
+        self.exploded_counter = 0  # number of explored cells containing a bomb
         self.trivial_counter = 0
+        self.pattern_counter = 0  # number of solver calls saved by pattern deductions (see patterns.py)
+
+        # the frontier, kept up to date on every open/mark:
+        #  - number cells that still have closed neighbours
+        #  - closed cells that neighbour at least one number cell
+        self.frontier_numbers = set()
+        self.frontier_closed = set()
+
+    def __getstate__(self):
+        # the view is created again when unpickling, a pickled view would be a copy that does not follow the game anymore
+        return {name: getattr(self, name) for name in self.__slots__ if name != 'visible_view'}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+        self.visible_view = self.visible.view()
+        self.visible_view.flags.writeable = False
+
+    @property
+    def explored(self):
+        """1 for every opened cell, 0 otherwise. Computed from the state on every access, use is_explored() for single cells."""
+        return self.state & EXPLORED
+
+    @property
+    def marked(self):
+        """1 for every marked cell, 0 otherwise. Computed from the state on every access, use is_marked() for single cells."""
+        return (self.state & MARKED) >> 1
 
     def open(self, x, y):
         """
@@ -28,98 +94,195 @@ class Minesweeper:
             self.field = self.generate_field((x, y))
 
         # if cell is already explored, ignore this call
-        if self.explored[x, y]:
+        if self.state[x, y] & EXPLORED:
             return False
-        
-        # otherwise, mark cell as explored
-        self.explored[x, y] = 1
-        self.open_counter += 1
 
-        if self.field[x, y] == -1:
-            return True
+        # a number or a bomb does not open any other cells
+        if self.field[x, y] != 0:
+            self.state[x, y] |= EXPLORED
+            if not self.state[x, y] & MARKED:
+                self.visible[x, y] = self.field[x, y]
+
+            self.open_counter += 1
+            self.exploded_counter += int(self.field[x, y] == -1)
+            self._update_frontier([x], [y])
+
+            return self.field[x, y] == -1
+
+        return self._open_cells(np.array([x]), np.array([y]))
+
+    def _open_cells(self, xs, ys):
+        """
+            Opens the given cells. Every cell around an opened 0 gets opened as well, until the whole region is opened.
+            Returns True if a bomb was hit, otherwise False.
+        """
+        # work on flat indices of a field padded by one cell, so that neighbours are never out of bounds
+        padded_height = self.height + 2
+        offsets = np.array([dx * padded_height + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx != 0 or dy != 0])
+
+        # the padding counts as visited, so it is never opened
+        visited = np.ones((self.width + 2, padded_height), dtype=bool)
+        visited[1:-1, 1:-1] = (self.state & EXPLORED) != 0
+        visited = visited.ravel()
+
+        zeros = np.zeros((self.width + 2, padded_height), dtype=bool)
+        zeros[1:-1, 1:-1] = self.field == 0
+        zeros = zeros.ravel()
+
+        # used to drop duplicates: of several writes to the same cell, only the last one survives
+        last_write = np.zeros(len(visited), dtype=np.int64)
+
+        def unvisited(cells):
+            cells = cells[~visited[cells]]
+            order = np.arange(len(cells))
+            last_write[cells] = order
+
+            return cells[last_write[cells] == order]
+
+        current = unvisited((np.asarray(xs) + 1) * padded_height + np.asarray(ys) + 1)
+        visited[current] = True
+        opened = [current]
+
+        # breadth-first search, expanding all cells of the current layer at once
+        while len(current) > 0:
+            current = unvisited((current[zeros[current], None] + offsets).ravel())
+            visited[current] = True
+            opened.append(current)
 
-        # if opening a 0, open up all neighbours automatically
-        if self.field[x, y] == 0:
-            for nx, ny in self._get_neighbours(x, y):
-                self.open(nx, ny)
+        opened_x, opened_y = np.divmod(np.concatenate(opened), padded_height)
+        opened_x, opened_y = opened_x - 1, opened_y - 1
 
+        self.state[opened_x, opened_y] |= EXPLORED
+        self.visible[opened_x, opened_y] = np.where(self.state[opened_x, opened_y] & MARKED, -3, self.field[opened_x, opened_y])
+        self.open_counter += len(opened_x)
+
+        exploded = int(np.sum(self.field[opened_x, opened_y] == -1))
+        self.exploded_counter += exploded
+        self._update_frontier(opened_x, opened_y)
+
+        return exploded > 0
+
+    def _update_frontier(self, xs, ys):
+        """Updates the frontier after the given cells got opened or marked."""
+        # for bigger changes, recomputing the frontier is cheaper than updating it cell by cell
+        if len(xs) * 64 > self.width * self.height:
+            self._rebuild_frontier()
+            return
+
+        changed = list(zip(np.asarray(xs).tolist(), np.asarray(ys).tolist()))
+
+        # the changed cells are not closed anymore and marked cells are no numbers
+        self.frontier_closed.difference_update(changed)
+        self.frontier_numbers.difference_update(changed)
+
+        # the changed cells themselves may be new numbers, and their neighbouring numbers may have lost their last closed neighbour
+        candidates = set(changed)
+        for cell in changed:
+            candidates.update(nb for nb in self._get_neighbours(*cell) if nb in self.frontier_numbers)
+
+        for x, y in candidates:
+            if self.state[x, y] != EXPLORED or self.field[x, y] < 0:
+                continue
+
+            closed = list(self._get_closed_neighbours(x, y))
+
+            if len(closed) > 0:
+                self.frontier_numbers.add((x, y))
+                self.frontier_closed.update(closed)
+            else:
+                self.frontier_numbers.discard((x, y))
+
+        # a marked number is no number anymore, so its closed neighbours might not neighbour any number now
+        for cell in changed:
+            if self.state[cell] == EXPLORED | MARKED:
+                for nb in self._get_closed_neighbours(*cell):
+                    if not any(n in self.frontier_numbers for n in self._get_neighbours(*nb)):
+                        self.frontier_closed.discard(nb)
+
+    def _rebuild_frontier(self):
+        """Recomputes the frontier from scratch."""
+        closed = self.state == 0
+        numbers = (self.state == EXPLORED) & (self.field >= 0)
+
+        self.frontier_numbers = set(map(tuple, np.argwhere(numbers & (neighbour_sum(closed) > 0)).tolist()))
+        self.frontier_closed = set(map(tuple, np.argwhere(closed & (neighbour_sum(numbers) > 0)).tolist()))
 
     def mark(self, x, y):
         """Mark a cell as bomb."""
-        self.marked[x, y] = 1
+        if self.state[x, y] & MARKED:
+            return
+
+        self.state[x, y] |= MARKED
+        self.visible[x, y] = -3
+        self.marked_counter += 1
+        self._update_frontier([x], [y])
+
+    def _mark_cells(self, xs, ys):
+        """Marks all the given cells as bombs."""
+        unmarked = self.state[xs, ys] & MARKED == 0
+        xs, ys = xs[unmarked], ys[unmarked]
+
+        self.state[xs, ys] |= MARKED
+        self.visible[xs, ys] = -3
+        self.marked_counter += len(xs)
+        self._update_frontier(xs, ys)
 
     def is_marked(self, x, y):
         """Returns True if this cell is marked, otherwise False."""
-        return self.marked[x, y] == 1
+        return self.state[x, y] & MARKED != 0
+
+    def is_explored(self, x, y):
+        """Returns True if this cell is explored (no matter whether it is marked as well), otherwise False."""
+        return self.state[x, y] & EXPLORED != 0
     
     def is_open(self, x, y):
         """Returns whether the given cell is opened (either opened or marked)."""
-        return self.marked[x, y] == 1 or self.explored[x, y] == 1
+        return self.state[x, y] != 0
 
     def is_closed(self, x, y):
         """Returns whether the given cell is closed (not opened and not marked)."""
-        return not self.is_open(x, y)
+        return self.state[x, y] == 0
 
     def is_done(self):
         """Returns True if all non-mined fields have been opened."""
-        # if the sum of the number of explored field plus the number of mines is equal to the number
+        # if the number of explored non-mine cells plus the number of mines is equal to the number
         # of total cells, the game is finished
-        return np.sum(np.where(self.field == -1, 1, self.explored)) == self.width * self.height
+        return self.open_counter - self.exploded_counter + self.mines == self.width * self.height
 
     def percentage_done(self):
         """Returns the percentage of how much of the field has been opened yet."""
-        return np.sum(self.explored) / (self.width * self.height - self.mines)
+        return self.open_counter / (self.width * self.height - self.mines)
 
     def generate_field(self, start_position=None):
         """Generate a new field by placing the mines randomly."""
-        # create a 1d array with exactly (number of mines) -1's and the rest filled with zeros         
-        field = np.concatenate([np.ones(self.mines) * -1, np.zeros(self.width * self.height - self.mines)])
+        # (flat) indices of all cells a mine may be placed on
+        candidates = np.arange(self.width * self.height)
 
-        # shuffle the 1d array to get a random mine placement
-        np.random.shuffle(field)
+        # make sure we do not have any bombs at the start position and its surrounding
+        if start_position:
+            x, y = start_position
+            start_area = np.zeros((self.width, self.height), dtype=bool)
+            start_area[max(x - 1, 0):x + 2, max(y - 1, 0):y + 2] = True
 
-        # reshape to 2d array to represent the field
-        field = field.reshape((self.width, self.height))
+            if (self.width * self.height) - np.sum(start_area) >= self.mines:
+                candidates = np.flatnonzero(~start_area)
 
-        # make sure we do not have any bombs at the start position and its surrounding
-        if start_position and (self.width * self.height) - 9 >= self.mines:
-            # number of bombs inside the starting neighbourhood
-            bombs = int(abs(np.sum(field[start_position[0] - 1:start_position[0]+2, start_position[1]-1:start_position[1]+2])))
-            # clear the starting neighbourhood
-            field[start_position[0] - 1:start_position[0]+2, start_position[1]-1:start_position[1]+2] = 0
-
-            # reintroduce the deleted bombs on new (not yet occupied) positions (not in the starting neighbourhood)
-            for _ in range(bombs):
-                while True:
-                    new_x = np.random.choice([n for n in range(self.width)])
-                    new_y = np.random.choice([n for n in range(self.height)])
-
-                    if new_x in range(start_position[0] - 1, start_position[0] + 2) and \
-                       new_y in range(start_position[1] - 1, start_position[1] + 2):
-                       continue
-
-                    if field[new_x, new_y] != -1:
-                        break
-                field[new_x, new_y] = -1
-
-        # calculate numbers
-        for x in range(self.width):
-            for y in range(self.height):
-                if field[x, y] != -1:
-                    field[x, y] = self._calculate_number_of_bombs(field, x, y)
-        
-        return field
+        # place all mines at once on distinct candidate cells
+        mines = np.zeros(self.width * self.height, dtype=bool)
+        mines[self.rng.choice(candidates, size=self.mines, replace=False)] = True
+        mines = mines.reshape((self.width, self.height))
+
+        # every other cell holds the number of neighbouring mines
+        return np.where(mines, -1, neighbour_sum(mines)).astype(np.int8)
 
 
     def get_visible_field(self):
         """
             Returns only the field that is currently visible.
             Unknown fields contain the value -2, marked cell contain the value -3.
+            The returned array is a read-only view that follows every change of the game, copy it to keep a snapshot.
         """
-        visible = np.where(self.explored == 1, self.field, -2)
-        flagged = np.where(self.marked == 1, -3, visible)
-
-        return flagged
+        return self.visible_view
 
     def open_trivials(self):
         """
@@ -128,61 +291,33 @@ class Minesweeper:
              - Looks for number-cells where the number of marked bombs plus the number of unknowns sum up to the cell value, 
                 marking the unknowns as bombs.
         """
-        visible_field = self.get_visible_field()
-
-        did_change = False
+        while True:
+            visible_field = self.get_visible_field()
 
-        # check each cell
-        for x in range(self.width):
-            for y in range(self.height):
-                cell = visible_field[x, y]
+            numbers = visible_field >= 0
+            unknowns = visible_field == -2
 
-                # ignore flagged or unknown
-                if cell == -3 or cell == -2 or cell == -1:
-                    continue
+            # count neighbouring bomb/unknown cells of all cells at once
+            number_of_bombs = neighbour_sum((visible_field == -3) | (visible_field == -1))
+            number_of_unknowns = neighbour_sum(unknowns)
 
-                # count neighbouring bomb/unknown cells
-                number_of_bombs = 0
-                number_of_unknowns = 0
+            # (1) numbers that are satisfied, all their unknown neighbours can be opened
+            satisfied = numbers & (number_of_bombs >= visible_field)
+            # (2) numbers whose neighbours can only be mines, all their unknown neighbours can be marked
+            saturated = numbers & (visible_field >= number_of_unknowns + number_of_bombs)
 
-                neighbours = list(self._get_neighbours(x, y))
-                
-                for nx, ny in neighbours:
-                    if visible_field[nx, ny] == -3 or visible_field[nx, ny] == -1:
-                        number_of_bombs += 1
-                    if visible_field[nx, ny] == -2:
-                        number_of_unknowns += 1
-                
-                # (1) check if number is satisfied, in which case we open it's neighbours
-                if number_of_bombs >= cell:
-                    for nx, ny in neighbours:
-                        if visible_field[nx, ny] == -2:
-                            self.open(nx, ny)
-                            did_change = True
-
-                # (2) check if a number's neighbours can only be mines, in which case we mark it as mines
-                if cell >= number_of_unknowns + number_of_bombs:
-                    for nx, ny in neighbours:
-                        if visible_field[nx, ny] == -2:
-                            self.mark(nx, ny)
-                            did_change = True
-
-        if did_change:
-            self.open_trivials()
-        
-                
-
-    def _calculate_number_of_bombs(self, field, x, y):
-        """Helper function to calculate the number of surrounding bombs."""
-        num = 0
+            to_open = unknowns & (neighbour_sum(satisfied) > 0)
+            to_mark = unknowns & (neighbour_sum(saturated) > 0) & ~to_open
 
-        for nx, ny in self._get_neighbours(x, y):
-            if field[nx, ny] == -1:
-                num += 1
+            # repeat until nothing changes anymore
+            if not to_open.any() and not to_mark.any():
+                break
 
-        return num 
+            if to_open.any():
+                self._open_cells(*np.nonzero(to_open))
+            if to_mark.any():
+                self._mark_cells(*np.nonzero(to_mark))
 
-    
     def _get_neighbours(self, x, y):
         """Returns all neighbouring cell's coordinates of the given cell."""
 
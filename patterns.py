@@ -0,0 +1,217 @@
+"""
+Local pattern deductions, run after Minesweeper.open_trivials() and before asking a solver.
+
+open_trivials() only looks at one number at a time. Most of the classic patterns (1-1 against a wall, 1-2-1, 1-2-2-1, ...)
+follow from two neighbouring numbers together: knowing how many mines are left around both of them and which cells
+only one of them touches often decides these cells.
+
+For every direction two neighbouring numbers can lie in, a table is generated that maps the closed cells of the window
+around both numbers (as bitmask) and the mines left around each of them to the cells of the window that are safe and that
+are mines in every possible assignment. The table covers all rotations and reflections of a pattern, as every pair of
+numbers is looked at from both sides. The whole field is scanned at once for every direction.
+
+Building the tables takes about a quarter of a second, so they are shipped precomputed in pattern-tables.npz and loaded
+on import (they are only built if the file is missing or does not fit). After changing how they are built, write the
+file again with:
+
+    python3 patterns.py
+"""
+
+import os
+
+import numpy as np
+
+from minesweeper import neighbour_sum
+
+# the directions from a number A to a neighbouring number B (the opposite ones are covered by swapping A and B)
+OFFSETS = [(1, 0), (0, 1), (1, 1), (1, -1)]
+
+MAX_MINES = 8
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pattern-tables.npz')
+
+
+def window(offset):
+    """Returns the cells around the numbers A = (0, 0) and B = offset (without A and B), relative to A."""
+    dx, dy = offset
+
+    cells = {(x, y) for x in range(-1, 2) for y in range(-1, 2)}
+    cells |= {(x + dx, y + dy) for x in range(-1, 2) for y in range(-1, 2)}
+
+    return sorted(cells - {(0, 0), (dx, dy)})
+
+def _popcount(values):
+    return np.array([bin(value).count('1') for value in values])
+
+def build_table(offset):
+    """
+        Returns (safe, mines): arrays indexed by [closed cells bitmask, mines left around A, mines left around B],
+        holding the bitmask of the window cells that are safe and that are mines in every assignment.
+        Both are 0 if the numbers cannot be satisfied.
+    """
+    cells = window(offset)
+
+    def region(condition):
+        return sum(1 << j for j, cell in enumerate(cells) if condition(cell))
+
+    def touches(cell, number):
+        return max(abs(cell[0] - number[0]), abs(cell[1] - number[1])) == 1
+
+    only_a = region(lambda cell: touches(cell, (0, 0)) and not touches(cell, offset))
+    only_b = region(lambda cell: touches(cell, offset) and not touches(cell, (0, 0)))
+    shared = region(lambda cell: touches(cell, (0, 0)) and touches(cell, offset))
+
+    masks = np.arange(1 << len(cells))
+    a = _popcount(masks & only_a)[:, None, None, None]
+    b = _popcount(masks & only_b)[:, None, None, None]
+    s = _popcount(masks & shared)[:, None, None, None]
+
+    # all assignments only differ in how many mines k lie on the shared cells, the rest is spread over the other cells
+    r_a = np.arange(MAX_MINES + 1)[None, :, None, None]
+    r_b = np.arange(MAX_MINES + 1)[None, None, :, None]
+    k = np.arange(MAX_MINES + 1)[None, None, None, :]
+
+    feasible = (k <= s) & (r_a - k >= 0) & (r_a - k <= a) & (r_b - k >= 0) & (r_b - k <= b)
+    possible = feasible.any(axis=-1)
+
+    def always(condition):
+        return possible & ~(feasible & ~condition).any(axis=-1)
+
+    masks = masks[:, None, None]
+
+    safe = np.where(always(r_a - k == 0), masks & only_a, 0) | \
+           np.where(always(r_b - k == 0), masks & only_b, 0) | \
+           np.where(always(k == 0), masks & shared, 0)
+
+    mines = np.where(always(r_a - k == a), masks & only_a, 0) | \
+            np.where(always(r_b - k == b), masks & only_b, 0) | \
+            np.where(always(k == s), masks & shared, 0)
+
+    return safe.astype(np.uint16), mines.astype(np.uint16)
+
+def _table_names(offset):
+    return f'safe_{offset[0]}_{offset[1]}', f'mines_{offset[0]}_{offset[1]}'
+
+def load_tables(file=TABLE_FILE):
+    """Returns the tables of all offsets, loaded from the given file or built where the file does not hold a fitting one."""
+    stored = {}
+    if os.path.exists(file):
+        with np.load(file) as data:
+            stored = {name: data[name] for name in data.files}
+
+    tables = {}
+    for offset in OFFSETS:
+        shape = (1 << len(window(offset)), MAX_MINES + 1, MAX_MINES + 1)
+        safe, mines = (stored.get(name) for name in _table_names(offset))
+
+        if safe is None or mines is None or safe.shape != shape or mines.shape != shape:
+            safe, mines = build_table(offset)
+
+        tables[offset] = (safe.astype(np.uint16), mines.astype(np.uint16))
+
+    return tables
+
+def save_tables(file=TABLE_FILE):
+    """Builds the tables of all offsets and writes them to the given file."""
+    tables = {}
+    for offset in OFFSETS:
+        tables.update(zip(_table_names(offset), build_table(offset)))
+
+    np.savez_compressed(file, **tables)
+
+TABLES = load_tables()
+
+def table(offset):
+    """Returns the tables (safe, mines) of the given offset, see build_table()."""
+    return TABLES[offset]
+
+
+def find_forced(game):
+    """Returns (to_open, to_mark): boolean fields of the closed cells that some pair of neighbouring numbers decides."""
+    visible_field = game.get_visible_field()
+    width, height = visible_field.shape
+
+    closed = visible_field == -2
+    numbers = (visible_field >= 0) & (neighbour_sum(closed) > 0)
+    mines_left = visible_field - neighbour_sum((visible_field == -3) | (visible_field == -1))
+    numbers &= (mines_left >= 0) & (mines_left <= MAX_MINES)
+
+    # pad by two cells, the padding is neither closed nor a number (so walls count as opened cells)
+    def pad(grid):
+        padded = np.zeros((width + 4, height + 4), dtype=grid.dtype)
+        padded[2:-2, 2:-2] = grid
+        return padded
+
+    def shifted(padded, x, y):
+        return padded[2 + x:2 + x + width, 2 + y:2 + y + height]
+
+    closed_p = pad(closed)
+    numbers_p = pad(numbers)
+    mines_left_p = pad(np.where(numbers, mines_left, 0))
+
+    to_open = np.zeros_like(closed_p)
+    to_mark = np.zeros_like(closed_p)
+
+    for offset in OFFSETS:
+        cells = window(offset)
+        safe_table, mines_table = table(offset)
+
+        pairs = numbers & shifted(numbers_p, *offset)
+        if not pairs.any():
+            continue
+
+        xs, ys = np.nonzero(pairs)
+
+        mask = np.zeros(len(xs), dtype=np.int64)
+        for j, (cx, cy) in enumerate(cells):
+            mask |= closed_p[xs + 2 + cx, ys + 2 + cy].astype(np.int64) << j
+
+        r_a = mines_left[xs, ys]
+        r_b = mines_left_p[xs + 2 + offset[0], ys + 2 + offset[1]]
+
+        safe = safe_table[mask, r_a, r_b]
+        mines = mines_table[mask, r_a, r_b]
+
+        for j, (cx, cy) in enumerate(cells):
+            opened = (safe >> j) & 1 == 1
+            marked = (mines >> j) & 1 == 1
+
+            to_open[xs[opened] + 2 + cx, ys[opened] + 2 + cy] = True
+            to_mark[xs[marked] + 2 + cx, ys[marked] + 2 + cy] = True
+
+    return to_open[2:-2, 2:-2], to_mark[2:-2, 2:-2]
+
+def open_patterns(game, trivials=True):
+    """
+        Opens and marks every cell decided by a pattern, followed by the trivial cases these lead to (unless trivials is
+        False), until nothing changes.
+        Returns the number of solver calls saved, i.e. how often a safe cell was found that would have needed a solver step.
+    """
+    if game.field is None:
+        return 0
+
+    saved = 0
+
+    while True:
+        to_open, to_mark = find_forced(game)
+
+        if not to_open.any() and not to_mark.any():
+            break
+
+        if to_open.any():
+            game._open_cells(*np.nonzero(to_open))
+            saved += 1
+        if to_mark.any():
+            game._mark_cells(*np.nonzero(to_mark))
+
+        if trivials:
+            game.open_trivials()
+
+    game.pattern_counter += saved
+
+    return saved
+
+
+if __name__ == '__main__':
+    save_tables()
+    print(f'--- pattern tables written to {TABLE_FILE} ---')
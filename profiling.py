@@ -0,0 +1,116 @@
+"""
+Where the time of a solving step goes.
+
+A profiler is handed to a solver (as its `profile`) by a driver, which starts a step before solving and ends it once the
+cells are applied. During the step, the solver times its phases (grouping, building facts or constraints, grounding,
+search, model iteration, ...) and counts what its backend did (clingo's atoms, rules, choices and models, the number of
+CPMpy solver calls and solutions). The time of a phase does not include the phases nested in it, so the phases of a
+step add up to at most the time of the step. Every step is written as a line of JSON, if a file is given.
+"""
+
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class NullProfiler:
+    """The profiler of a solver that is not profiled, every call does nothing."""
+
+    def phase(self, name):
+        return nullcontext()
+
+    def count(self, name, value=1):
+        pass
+
+    def clingo_statistics(self, ctl):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    """
+        Collects the phase timings and counters of every step.
+        file: the file to append a JSON line per step to (None to only keep the steps in memory)
+        context: fields added to every step, e.g. the solver and the seed
+    """
+
+    def __init__(self, file=None, **context):
+        self.file = file
+        self.context = context
+        self.steps = []
+
+        self.step = None
+        self.nested = []  # time spent in the phases nested in every running phase
+
+    def start_step(self):
+        self.step = {'start': time.perf_counter(), 'phases': {}, 'counters': {}}
+        self.nested = []
+
+    def end_step(self, **info):
+        """Finishes the current step, with the given fields added to it, and returns its record."""
+        if self.step is None:
+            self.start_step()
+
+        record = dict(self.context)
+        record['step'] = len(self.steps)
+        record['time'] = time.perf_counter() - self.step['start']
+        record.update(info)
+        record['phases'] = self.step['phases']
+        record['counters'] = self.step['counters']
+
+        self.steps.append(record)
+        self.step = None
+
+        if self.file is not None:
+            # a single write per line, so several processes can append to the same file
+            with open(self.file, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+        return record
+
+    @contextmanager
+    def phase(self, name):
+        """Adds the time spent in the block (minus its nested phases) to the given phase of the current step."""
+        if self.step is None:
+            self.start_step()
+
+        start = time.perf_counter()
+        self.nested.append(0.0)
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self.nested.pop()
+
+            if self.nested:
+                self.nested[-1] += elapsed
+
+            phases = self.step['phases']
+            phases[name] = phases.get(name, 0.0) + elapsed - nested
+
+    def count(self, name, value=1):
+        if self.step is None:
+            self.start_step()
+
+        counters = self.step['counters']
+        counters[name] = counters.get(name, 0) + value
+
+    def clingo_statistics(self, ctl):
+        """Adds clingo's statistics of the last solve call: the size of the ground program and the work of the search."""
+        if self.step is None:
+            self.start_step()
+
+        statistics = ctl.statistics
+        counters = self.step['counters']
+
+        # several solve calls of a step usually share the program, so its size is the biggest one seen
+        for name in ('atoms', 'rules'):
+            counters[name] = max(counters.get(name, 0), int(statistics['problem']['lp'][name]))
+
+        self.count('choices', int(statistics['solving']['solvers']['choices']))
+        self.count('conflicts', int(statistics['solving']['solvers']['conflicts']))
+        self.count('models', int(statistics['summary']['models']['enumerated']))
+        self.count('clingo_solves')
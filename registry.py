@@ -0,0 +1,54 @@
+"""
+Registry of the solvers, by the name they are selected with on the command line.
+
+A solver is registered by the module and class that implement it, the module is only imported once the solver is
+asked for, so a run never pays for importing backends (clingo, CPMpy and OR-tools) it does not use. New solvers are
+added with register(), without editing the drivers:
+
+    registry.register('my-solver', 'solver_mine', 'MySolver')
+    solver_class = registry.get('my-solver')
+
+The clingo encodings are resolved relative to the package with program_path(), so the solvers work from any directory.
+"""
+
+import importlib
+import os
+
+PROGRAM_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clingo-programs')
+
+# solver name -> (module, class, whether it can solve groups in worker processes)
+_solvers = {}
+
+
+def program_path(name):
+    """Returns the path of the given clingo encoding."""
+    return os.path.join(PROGRAM_DIRECTORY, name)
+
+def register(name, module, class_name, workers=False):
+    """Registers the solver class `class_name` of the given module under the given name (replacing any solver of that name)."""
+    _solvers[name] = (module, class_name, workers)
+
+def names():
+    """Returns the names of all registered solvers, in the order they were registered."""
+    return list(_solvers)
+
+def supports_workers(name):
+    """Returns whether the solver of the given name accepts the workers argument."""
+    return _solvers[name][2]
+
+def get(name):
+    """Returns the solver class of the given name, importing its module if this has not happened yet."""
+    if name not in _solvers:
+        raise KeyError(f'solver "{name}" is not registered, choose one of {names()}')
+
+    module, class_name, _ = _solvers[name]
+
+    return getattr(importlib.import_module(module), class_name)
+
+
+register('clingo', 'solver_clingo', 'ClingoSolver')
+register('clingo-grouped', 'solver_clingo_grouped', 'ClingoSolverGrouped', workers=True)
+register('csp', 'solver_csp', 'CSPSolver')
+register('csp-persistent', 'solver_csp', 'PersistentCSPSolver')
+register('csp-grouped', 'solver_csp_grouped', 'CSPSolverGrouped', workers=True)
+register('probability', 'solver_probability', 'ProbabilitySolver')
@@ -5,10 +5,11 @@ import logging
 import numpy as np
 
 from minesweeper import Minesweeper
-from solver_clingo import ClingoSolver
-from solver_clingo_grouped import ClingoSolverGrouped
-from solver_csp import CSPSolver
-from solver_csp_grouped import CSPSolverGrouped
+import registry
+from patterns import open_patterns
+from solver_base import apply_batch
+from profiling import Profiler, NULL_PROFILER
+from traces import Trace
 
 
 if __name__ == '__main__':
@@ -25,53 +26,103 @@ if __name__ == '__main__':
     parser.add_argument('-he', '--height', help='The height of the minesweeper instance', type=int, default=16) 
     parser.add_argument('-b', '--bombs', help='The number of bombs of the minesweeper instance', type=int, default=99) 
     parser.add_argument('-s', '--seed', help='Fixes the seed to generate the random minesweeper instance', type=int) 
-    parser.add_argument('--solver', choices=['clingo', 'clingo-grouped', 'csp', 'csp-grouped'], const='clingo-grouped', default='clingo-grouped', nargs='?', help='The solving approach to use')
+    parser.add_argument('--solver', choices=registry.names(), const='clingo-grouped', default='clingo-grouped', nargs='?', help='The solving approach to use')
+    parser.add_argument('--step-budget', help='Time limit in seconds for a single solving step, after which the solver estimates the probabilities from the solutions found so far', type=float)
+    parser.add_argument('--workers', help='Number of worker processes that solve independent groups in parallel (grouped solvers only)', type=int)
     parser.add_argument('--no-trivial', help='If set, do not perform trivial cell opening/marking', action='store_true')
+    parser.add_argument('--no-patterns', help='If set, do not open/mark cells decided by local patterns of neighbouring numbers', action='store_true')
+    parser.add_argument('--profile', help='A file to append the phase timings and backend statistics of every solving step to (as JSON lines)')
+    parser.add_argument('--trace', help='A file to write the trace of the game to, to replay its positions later (see traces.py)')
     parser.add_argument('-d', '--delay', help='Delay in milliseconds between performing actions', type=int) 
     parser.add_argument('-i', '--interactive', help='If set, waits for user input between each action', action='store_true')
 
     args = parser.parse_args()
     print(args)
 
+    if args.workers is not None and not registry.supports_workers(args.solver):
+        parser.error('--workers is only supported by the grouped solvers')
+
     # fix random seed
     seed = int(time.time() * 1000) % (2**32 - 1) if args.seed is None else args.seed
     print('Seed: ', seed)
-    np.random.seed(seed)
 
     # initialize the minesweeper instance
-    g = Minesweeper(args.width, args.height, args.bombs)
+    g = Minesweeper(args.width, args.height, args.bombs, rng=np.random.default_rng(seed))
+
+    trace = Trace(seed, args.width, args.height, args.bombs) if args.trace is not None else None
 
     # open the first field (so the solver has something to go on)
-    if g.open(*(2, 2) if args.width >= 3 and args.height >= 3 else (0, 0)):
+    start = (2, 2) if args.width >= 3 and args.height >= 3 else (0, 0)
+    if trace is not None:
+        trace.open(*start)
+
+    if g.open(*start):
         print('Game lost on first cell opened :(')
         exit()
 
-    # instantiate the solver given as argument
-    solver_tuples = [('clingo', ClingoSolver), ('clingo-grouped', ClingoSolverGrouped), ('csp', CSPSolver), ('csp-grouped', CSPSolverGrouped)]
+    # instantiate the solver given as argument (only its backend gets imported)
+    solver_class = registry.get(args.solver)
 
-    for solver_name, solver_class in solver_tuples:
-        if args.solver == solver_name:
-            s = solver_class(g)
+    if args.workers is not None:
+        s = solver_class(g, step_budget=args.step_budget, workers=args.workers)
+    else:
+        s = solver_class(g, step_budget=args.step_budget)
 
-    if not s:
-        assert False, f'solver "{args.solver}" not implemented'
-        
+    # profile every step, from solving up to the patterns applied afterwards
+    profiler = NULL_PROFILER
+    if args.profile is not None:
+        profiler = s.profile = Profiler(args.profile, solver=args.solver, seed=seed)
 
     start_time = time.time()
     steps_done = 1
 
     while True:
-        best_action = s.solve_step()
-        print(f'--- OPENING {best_action} ---')
+        if args.profile is not None:
+            profiler.start_step()
+
+        batch = s.solve_batch()
+        safe, mines, guess = batch
+
+        if trace is not None:
+            trace.solve()
+            trace.batch(batch)
+
+        if len(mines) > 0:
+            print(f'--- MARKING {mines} ---')
+        if len(safe) > 0:
+            print(f'--- OPENING {safe} ---')
+        else:
+            print(f'--- OPENING {guess}{"" if s.last_exact else " (estimated)"} ---')
+
+        # apply the whole batch before solving again
+        with profiler.phase('apply'):
+            lost = apply_batch(g, batch)
+
+        if lost:
+            if args.profile is not None:
+                profiler.end_step(safe=len(safe), mines=len(mines), guess=len(safe) == 0, lost=True)
 
-        if g.open(*best_action):
             print('\n===== GAME OVER =====')
             break
         
         steps_done += 1
 
         if not args.no_trivial:
-            g.open_trivials()
+            with profiler.phase('trivial'):
+                g.open_trivials()
+
+            if trace is not None:
+                trace.trivial()
+
+        if not args.no_patterns:
+            with profiler.phase('patterns'):
+                open_patterns(g, trivials=not args.no_trivial)
+
+            if trace is not None:
+                trace.patterns(trivials=not args.no_trivial)
+
+        if args.profile is not None:
+            profiler.end_step(safe=len(safe), mines=len(mines), guess=len(safe) == 0, lost=False)
 
         if g.is_done():
             print('\n===== WON =====')
@@ -85,8 +136,12 @@ if __name__ == '__main__':
         elif args.delay is not None:
             time.sleep(args.delay / 1000)
 
+    if trace is not None:
+        trace.save(args.trace)
+
     if not args.interactive:
         print('--- {0:.2f} seconds ---'.format((time.time() - start_time)))
     print('--- {0:.1f}% cells opened ---'.format(g.percentage_done() * 100))
     print('--- {0} (non-trivial) actions done ---'.format((steps_done)))
+    print('--- {0} solver calls saved by patterns ---'.format(g.pattern_counter))
     print('--- seed: {} --- '.format(seed))
\ No newline at end of file
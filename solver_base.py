@@ -0,0 +1,69 @@
+import numpy as np
+
+from profiling import NULL_PROFILER
+
+
+class Solver:
+    """
+        Base of the solvers. A solver finds all the cells it can prove to be safe or mines at once in solve_batch(),
+        solve_step() hands them out one cell at a time for callers that open a single cell per step.
+        Solvers set self.game and self.safe_cells (the cells proven to be safe, that have not been opened yet).
+        A driver can set a profiling.Profiler as the profile of a solver, to see where the time of its steps goes.
+    """
+
+    profile = NULL_PROFILER
+
+    def solve_batch(self):
+        """
+            Returns (safe, mines, guess): the closed cells proven to be safe and proven to be mines, and the cell that is
+            the least likely to be a mine if no cell is proven to be safe (None otherwise). The game is left unchanged.
+        """
+        raise NotImplementedError
+
+    def solve_step(self):
+        """Marks the proven mines and returns the next cell to open."""
+        # open the cells proven to be safe in an earlier step first
+        while self.safe_cells:
+            cell = self.safe_cells.pop()
+            if self.game.is_closed(*cell):
+                self.last_exact = True
+                return cell
+
+        safe, mines, guess = self.solve_batch()
+
+        for cell in mines:
+            self.game.mark(*cell)
+
+        if len(safe) == 0:
+            return guess
+
+        # the first safe cell is opened right away, the others in the next steps
+        self.safe_cells = list(reversed(safe))
+        return self.safe_cells.pop()
+
+    def any_closed_cell(self, exclude=()):
+        """
+            Returns some closed cell that is not in exclude (the proven mines), the guess for when no closed cell
+            neighbours a number (or there is no solution).
+        """
+        closed = (self.game.explored == 0) & (self.game.marked == 0)
+        for x, y in exclude:
+            closed[x, y] = False
+
+        closed = np.argwhere(closed)
+
+        return tuple(int(i) for i in closed[0]) if len(closed) > 0 else None
+
+
+def apply_batch(game, batch):
+    """
+        Marks the mines of a batch returned by Solver.solve_batch() and opens its safe cells, or its guess if there are none.
+        Returns True if a bomb was hit.
+    """
+    safe, mines, guess = batch
+
+    for cell in mines:
+        game.mark(*cell)
+
+    # stop at the first bomb, which can only be hit by a guess
+    return any(game.open(*cell) for cell in (safe if len(safe) > 0 else [guess]))
@@ -3,79 +3,200 @@ import time
 import os
 import argparse
 
+import numpy as np
+
 from clingo.symbol import Number, Function
 from clingo.control import Control
 
 from minesweeper import Minesweeper
+from solver_base import Solver
+from profiling import NULL_PROFILER
+from registry import program_path
+
+
+def cautious_consequences(ctl, deadline=None, profile=NULL_PROFILER):
+    """
+        Returns the cells that are opened and the cells that are bombs in every answer set (in clingo coordinates),
+        using clingo's cautious reasoning instead of enumerating all answer sets. Returns None if there is no answer set,
+        or if the deadline (a time.time() value) is reached before the consequences are known.
+        The cell of an open or bomb atom are its last two arguments.
+    """
+    ctl.configuration.solve.enum_mode = 'cautious'
+
+    # every model found narrows the consequences down, the last one holds the atoms true in all answer sets
+    symbols = None
+    try:
+        with profile.phase('search'):
+            for model_symbols in _models(ctl, deadline):
+                symbols = model_symbols
+
+        if symbols is None or symbols is TIMEOUT:
+            return None
+    finally:
+        ctl.configuration.solve.enum_mode = 'auto'
+        profile.clingo_statistics(ctl)
+
+    safe = sorted((s.arguments[-2].number, s.arguments[-1].number) for s in symbols if s.name == 'open')
+    bombs = sorted((s.arguments[-2].number, s.arguments[-1].number) for s in symbols if s.name == 'bomb')
+
+    return safe, bombs
+
+def count_models(ctl, deadline=None, profile=NULL_PROFILER):
+    """
+        Enumerates the answer sets and counts for every cell in how many of them it is opened and a bomb (in clingo coordinates).
+        If a deadline (a time.time() value) is given, the enumeration stops there, as soon as at least one answer set was found.
+        Returns (actions, bombs, model_count, exact), where exact tells whether all answer sets were counted.
+    """
+    actions = {}
+    bombs = {}
+    model_count = 0
+    symbols = None
+
+    with profile.phase('search'):
+        for symbols in _models(ctl, deadline, at_least=1):
+            if symbols is TIMEOUT:
+                break
+
+            # the time spent on the answer sets themselves, apart from finding them
+            with profile.phase('models'):
+                for symbol in symbols:
+                    cell = (symbol.arguments[-2].number, symbol.arguments[-1].number)
+
+                    if symbol.name == 'open':
+                        actions[cell] = actions.get(cell, 0) + 1
+
+                    if symbol.name == 'bomb':
+                        bombs[cell] = bombs.get(cell, 0) + 1
+
+            model_count += 1
+
+    profile.clingo_statistics(ctl)
+
+    return actions, bombs, model_count, symbols is not TIMEOUT
 
-class ClingoSolver:
+# yielded by _models instead of the next model when the deadline is reached
+TIMEOUT = object()
 
-    def __init__(self, game):
+def _models(ctl, deadline=None, at_least=0):
+    """Yields the shown symbols of every model, or TIMEOUT (once, as last item) if the deadline is reached after at_least models."""
+    with ctl.solve(yield_=True, async_=True) as hnd:
+        found = 0
+
+        while True:
+            hnd.resume()
+
+            # models might be found faster than they are looked at, so the time is checked before waiting for the next one
+            if deadline is not None and found >= at_least and (time.time() >= deadline or not hnd.wait(deadline - time.time())):
+                hnd.cancel()
+                yield TIMEOUT
+                return
+
+            m = hnd.model()
+            if m is None:
+                return
+
+            found += 1
+            yield m.symbols(shown=True)
+
+
+class ClingoSolver(Solver):
+
+    def __init__(self, game, consequences=True, step_budget=None):
         self.game = game
+        self.consequences = consequences  # look for certain moves before enumerating all answer sets
+        self.step_budget = step_budget  # time in seconds a step may take at most, after which the answer sets seen so far are used
+        self.last_exact = True  # whether the last step was based on all answer sets (or on the ones found within the budget)
+        self.safe_cells = []  # cells proven to be safe, that have not been opened yet
         self.reset()
 
     def reset(self):
+        """
+            Starts a new solving session: the program is grounded step by step over the whole game,
+            so every step only grounds the cells that changed since the last one.
+        """
         self.ctl = Control()
         self.ctl.configuration.solve.models = 0 # return all models
-        self.ctl.load('clingo-programs/v4.lp') # load the solver program
-        self.ctl.add(f'width({self.game.width}).\nheight({self.game.height}).\nnumberOfBombs({self.game.mines}).')
+        self.ctl.load(program_path('session.lp')) # load the solver program
 
+        self.cells = {}  # grounded cells -> their last known state (revealed, flagged)
+        self.numbers = set()  # grounded numbers
+        self.step = 0
 
-    def solve_step(self):
-        self.reset()
-        
-        visible_field = self.game.get_visible_field()
-
-        for x in range(self.game.width):
-            for y in range(self.game.height):
-                cell = visible_field[x, y]
-
-                if cell == -2:
-                    continue
-                
-                # if it is a marked bomb, add this as fact to our assumptions
-                if cell == -3:
-                    # self.ctl.add(f'bomb({x + 1}, {y + 1}).')
-                    pass
-                else:
-                    self.ctl.add(f'number({x + 1}, {y + 1}, {int(cell)}).')
-        
-        self.ctl.ground()
-
-        actions = {}
-        bombs = {}
-        model_count = 0
-
-        with self.ctl.solve(yield_=True) as hnd:
-            for m in hnd:
-                symbols = m.symbols(shown=True)
 
-                for symbol in symbols:
-                    if symbol.name == 'open':
-                        action = (symbol.arguments[0].number, symbol.arguments[1].number)
+    def solve_batch(self):
+        deadline = None if self.step_budget is None else time.time() + self.step_budget
+        self.last_exact = True
 
-                        if not action in actions:
-                            actions[action] = 1
-                        else:
-                            actions[action] += 1
-                    
-                    if symbol.name == 'bomb':
-                        bomb = (symbol.arguments[0].number, symbol.arguments[1].number)
+        with self.profile.phase('grounding'):
+            self.update_session()
+
+        mines = []
+        if self.consequences:
+            consequences = cautious_consequences(self.ctl, deadline, self.profile)
+
+            if consequences is not None:
+                safe, bombs = consequences
+                # the flagged cells are bombs in every answer set as well, only the closed ones are new
+                mines = [(x - 1, y - 1) for x, y in bombs if self.game.is_closed(x - 1, y - 1)]
 
-                        if not bomb in bombs:
-                            bombs[bomb] = 1
-                        else:
-                            bombs[bomb] += 1
+                # the cells opened in every answer set can all be opened
+                if len(safe) > 0:
+                    return [(x - 1, y - 1) for x, y in safe], mines, None
 
-                model_count += 1
-        
-        proofen_bombs = filter(lambda b: bombs[b] == model_count, bombs)
-        for proofen_bomb in proofen_bombs:
-            self.game.mark(proofen_bomb[0] - 1, proofen_bomb[1] - 1)
+        # no certain move, so count in how many answer sets each cell is opened
+        actions, bombs, model_count, self.last_exact = count_models(self.ctl, deadline, self.profile)
+
+        # only if all answer sets were seen, a cell opened or a bomb in all of them is proven
+        # (adjusted for a coordinate system that starts with 0, the clingo implementation starts at 1)
+        if self.last_exact and model_count > 0:
+            safe = sorted((x - 1, y - 1) for (x, y), count in actions.items() if count == model_count)
+            mines = sorted(set(mines) | {(x - 1, y - 1) for (x, y), count in bombs.items()
+                                         if count == model_count and self.game.is_closed(x - 1, y - 1)})
+
+            if len(safe) > 0:
+                return safe, mines, None
+
+        if len(actions) == 0:
+            return [], mines, self.any_closed_cell(mines)
 
         # select action that occured most often in the answer set
-        # at best, it is one that occured in ALL the answer sets, which would make this action 100% safe
         best_action = max(actions, key=actions.get)
 
-        # return the best action adjusted for a coordinate system that starts with 0 (the clingo implementation starts at 1)
-        return (best_action[0] - 1, best_action[1] - 1)
\ No newline at end of file
+        return [], mines, (best_action[0] - 1, best_action[1] - 1)
+
+    def update_session(self):
+        """Grounds the numbers revealed (and the cells they newly constrain) since the last step and updates the cell states."""
+        parts = []
+
+        for x, y in sorted(self.game.frontier_numbers - self.numbers):
+            for nx, ny in self.game._get_neighbours(x, y):
+                # every neighbour that is not yet opened (even if marked) might be a bomb
+                if (nx, ny) not in self.cells and not self.game.is_explored(nx, ny):
+                    self.cells[(nx, ny)] = (False, False)
+                    parts.append(('cell', [Number(nx + 1), Number(ny + 1)]))
+
+            parts.append(('number', [Number(x + 1), Number(y + 1), Number(int(self.game.field[x, y]))]))
+            self.numbers.add((x, y))
+
+        # marked cells that are not grounded do not count towards the bombs that may still be placed
+        flagged = sum(1 for x, y in self.cells if self.game.is_marked(x, y))
+        max_bombs = self.game.mines - (self.game.marked_counter - flagged)
+
+        # replace the bomb limit of the last step by a new one
+        if self.step > 0:
+            self.ctl.release_external(Function('active', [Number(self.step)]))
+
+        self.step += 1
+        parts.append(('step', [Number(self.step), Number(max_bombs)]))
+
+        self.ctl.ground(parts)
+        self.ctl.assign_external(Function('active', [Number(self.step)]), True)
+
+        # update the state of every cell that changed (externals of new cells start out as false)
+        for (x, y), state in self.cells.items():
+            new_state = (bool(self.game.is_explored(x, y)), bool(self.game.is_marked(x, y)))
+
+            if new_state != state:
+                self.ctl.assign_external(Function('revealed', [Number(x + 1), Number(y + 1)]), new_state[0])
+                self.ctl.assign_external(Function('flagged', [Number(x + 1), Number(y + 1)]), new_state[1])
+                self.cells[(x, y)] = new_state
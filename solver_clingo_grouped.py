@@ -2,177 +2,231 @@ import logging
 import time
 import os
 
+import numpy as np
+
 from clingo.symbol import Number, Function
 from clingo.control import Control
 
 from minesweeper import Minesweeper
+from grouping import FrontierGrouping
+from solver_clingo import cautious_consequences, count_models
+from solver_base import Solver
+from registry import program_path
+import component_cache
+import worker_pool
+
+
+def solve_group_program(facts, group_id, deadline=None):
+    """
+        Solves a single group in a program of its own, given by its facts (see grouped.lp). Only needs the facts (not the game),
+        so it can run in a worker process as well. Returns (bombs, model_count, exact) like ClingoSolverGrouped.solve_group().
+    """
+    ctl = Control()
+    ctl.configuration.solve.models = 0 # return all models
+    ctl.load(program_path('grouped.lp')) # load the solver program
+    ctl.add(facts)
+    ctl.ground()
+
+    ctl.assign_external(Function('active', [Number(group_id)]), True)
+    _, bombs, model_count, exact = count_models(ctl, deadline)
 
-class ClingoSolverGrouped:
+    return {(x - 1, y - 1): count for (x, y), count in bombs.items()}, model_count, exact
 
-    def __init__(self, game):
+
+class ClingoSolverGrouped(Solver):
+
+    def __init__(self, game, consequences=True, step_budget=None, cache=None, workers=None, inline_size=12):
         self.game = game
-        self.reset()
+        self.grouping = FrontierGrouping(game)
+        self.cache = cache if cache is not None else component_cache.shared  # groups solved before, in this or other games
+        self.consequences = consequences  # look for certain moves in all groups before enumerating any answer sets
+        self.step_budget = step_budget  # time in seconds a step may take at most, shared evenly by the groups
+        self.last_exact = True  # whether the last step was based on all answer sets of every group
+        self.safe_cells = []  # cells proven to be safe, that have not been opened yet
+        self.workers = workers  # number of worker processes to solve groups in parallel (None to solve all groups here)
+        self.inline_size = inline_size  # groups with fewer closed cells are not worth sending to a worker
 
     def reset(self):
         self.ctl = Control()
         self.ctl.configuration.solve.models = 0 # return all models
-        self.ctl.load('clingo-programs/grouped.lp') # load the solver program
-        self.ctl.add(f'width({self.game.width}).\nheight({self.game.height}).\nnumberOfBombs({self.game.mines}).')
+        self.ctl.load(program_path('grouped.lp')) # load the solver program
+        self.ctl.add(f'numberOfBombs({self.game.mines}).')
+
+    def solve_batch(self):
+        self.last_exact = True
 
-    def solve_step(self):
-        best_actions = self.solve_groups()
-        best_action = max(best_actions, key=lambda a: a[1])[0]
+        safe, mines, actions = self.solve_groups()
+        if len(safe) > 0:
+            return safe, mines, None
 
-        return (best_action[0] - 1, best_action[1] - 1)
+        # a group cut off by the deadline can still hold a cell the cautious check proved to be a mine
+        proven = set(mines)
+        actions = [action for action in actions if (action[0][0] - 1, action[0][1] - 1) not in proven]
+
+        if len(actions) == 0:
+            return [], mines, self.any_closed_cell(mines)
+
+        best_action = max(actions, key=lambda a: a[1])[0]
+
+        return [], mines, (best_action[0] - 1, best_action[1] - 1)
 
     def solve_groups(self):
-        actions = []
+        """
+            Returns (safe, mines, actions): the cells proven to be safe and to be bombs, and the best action of every group
+            as (action, probability of being safe, whether the probability is exact).
+        """
+        deadline = None if self.step_budget is None else time.time() + self.step_budget
+
+        # get groups of numbers together with the closed cells around them
+        with self.profile.phase('grouping'):
+            groups = self.grouping.groups()
 
-        # get groups
-        groups = self.find_unopened_groups()
+        # look up the groups that have been solved before, only the others need to be solved
+        # (the bomb limit only matters for groups that could hold more bombs than are left)
+        with self.profile.phase('cache'):
+            mines_left = self.game.mines - self.game.marked_counter
+            keys = [component_cache.group_key(self.game, group, group_asked, mines_left) for group, group_asked in groups]
 
-        for group in groups:
-            group_asked = []
-            for cell in group:
-                group_asked += self.game._get_closed_neighbours(*cell)
+            results = {}  # group id -> (cells, bombs per cell, model count, exact)
+            for group_id, (key, cells) in enumerate(keys):
+                cached = self.cache.get(key)
+                if cached is not None:
+                    results[group_id] = (cells, dict(zip(cells, cached[1])), cached[0], True)
 
-            group_asked = list(set(group_asked))
+        unsolved = [group_id for group_id in range(len(groups)) if group_id not in results]
 
-            best_group_action = self.solve_group(group_asked)
+        # encode all unsolved groups, tagged with their index, into a single program that is grounded only once
+        with self.profile.phase('facts'):
+            marked = self.marked_facts()
+        if len(unsolved) > 0:
+            self.ground_groups(groups, unsolved, marked)
+
+        # the mines proven here are kept, even if the enumeration below runs out of time
+        certain_mines = []
+        if self.consequences:
+            safe, certain_mines = self.certain_cells(unsolved, results.values(), deadline)
+            if len(safe) > 0:
+                return safe, certain_mines, []
+
+        def worker_task(group_id, group_deadline):
+            with self.profile.phase('facts'):
+                facts = '\n'.join(self.group_facts(groups, [group_id]) + marked + [f'numberOfBombs({self.game.mines}).'])
+
+            return solve_group_program, facts, group_id, group_deadline
+
+        solved = worker_pool.solve_groups(groups, unsolved, self.solve_group, worker_task, self.workers, self.inline_size, deadline, self.profile)
+
+        for group_id, (bombs, model_count, exact) in solved.items():
+            cells = keys[group_id][1]
+
+            # only complete results may be reused
+            if exact:
+                self.cache.put(keys[group_id][0], (model_count, tuple(bombs.get(cell, 0) for cell in cells)))
+
+            results[group_id] = (cells, bombs, model_count, exact)
+
+        safe, mines = self.proven_cells(results[group_id] for group_id in range(len(groups)))
+        mines = sorted(set(mines) | set(certain_mines))
+
+        actions = []
+        for group_id in range(len(groups)):
+            best_group_action = self.group_action(*results[group_id])
             if best_group_action is not None:
                 actions.append(best_group_action)
 
-        return actions
-
-    def solve_group(self, asked_for):
-        self.reset()
-        
-        visible_field = self.game.get_visible_field()
-
-        for x in range(self.game.width):
-            for y in range(self.game.height):
-                cell = visible_field[x, y]
-
-                if cell == -2:
-                    continue
-                
-                # if it is a marked bomb, add this as fact to our assumptions
-                if cell == -3:
-                    self.ctl.add(f'bomb({x + 1}, {y + 1}).')
-                else:
-                    self.ctl.add(f'number({x + 1}, {y + 1}, {int(cell)}).')
-
-        for asked_x, asked_y in asked_for:
-            self.ctl.add(f'asked({asked_x + 1}, {asked_y + 1}).')
-
-        self.ctl.ground()
-
-        actions = {}
-        bombs = {}
-        model_count = 0
-
-        with self.ctl.solve(yield_=True) as hnd:
-            for m in hnd:
-                symbols = m.symbols(shown=True)
-
-                for symbol in symbols:
-                    if symbol.name == 'open':
-                        action = (symbol.arguments[0].number, symbol.arguments[1].number)
-
-                        if not action in actions:
-                            actions[action] = 1
-                        else:
-                            actions[action] += 1
-                    
-                    if symbol.name == 'bomb':
-                        bomb = (symbol.arguments[0].number, symbol.arguments[1].number)
-
-                        if not bomb in bombs:
-                            bombs[bomb] = 1
-                        else:
-                            bombs[bomb] += 1
-
-                model_count += 1
-        
-        proofen_bombs = filter(lambda b: bombs[b] == model_count, bombs)
-        for proofen_bomb in proofen_bombs:
-            self.game.mark(proofen_bomb[0] - 1, proofen_bomb[1] - 1)
-
-        if len(actions) == 0:
-            return 
-
-        # select action that occured most often in the answer set
-        # at best, it is one that occured in ALL the answer sets, which would make this action 100% safe
-        best_action = max(actions, key=actions.get)
-
-        return best_action, actions[best_action] / model_count
-
-    def find_unopened_groups(self):
-        visible_field = self.game.get_visible_field()
-        
-        seen = set()
-
-        def is_open(cell):
-                cv = visible_field[cell[0], cell[1]]
-                return cv != -2 or self.game.marked[cell[0], cell[1]] == 1
-        def is_closed(cell):
-            return not is_open(cell)
-
-        def hasCommonClosedNeighbour(cell1, cell2):    
-            neighbours1 = set(filter(is_closed, self.game._get_neighbours(cell1[0], cell1[1])))
-            neighbours2 = set(filter(is_closed, self.game._get_neighbours(cell2[0], cell2[1])))
-
-            intersection = neighbours1.intersection(neighbours2)
-
-            return len(intersection) > 0
-
-        def hasClosedNeighbours(cell):
-            return len(list(filter(is_closed, self.game._get_neighbours(cell[0], cell[1])))) > 0
-
-        def group(cell, current_group, last_cell):
-            cv = visible_field[cell[0], cell[1]]
-
-            if cv == -2:
-                for neighbour in self.game._get_neighbours(cell[0], cell[1]):
-                    
-                    if not (self.game.is_closed(*cell) and self.game.is_closed(*neighbour)):
-                        group(neighbour, current_group, cell)
-            else:
-                # ignore cells without unknown neighbours, since they won't contribute to the search in any way
-                if not hasClosedNeighbours(cell):
-                    return
-
-                # ignore cells that do not have any mines as neighbours (which again wont contribute to search)
-                # ignore cells that have been already visited as a stop condition for the recursion
-                # ignore cells that have been marked (which in our case means, that the AI is sure there is a mine)
-                if cv == 0 or cell in seen or self.game.marked[cell[0], cell[1]] == 1:
-                    return
-                
-                # also stop, if this has been a recursive call (last_cell != None) but there are no common closed 
-                # neighbours between the last_cell and the current cell (which means they should NOT be in the same group)
-                if last_cell is not None and visible_field[last_cell[0], last_cell[1]] != -2 and not hasCommonClosedNeighbour(cell, last_cell):
-                    return
-
-                # so if current is not unknown (we do not want unknowns in the group) and current and last cells have at least 
-                # one common closed neighbour, we can expand the current group with the current cell and mark the current cell as seen
-                current_group.append(cell)
-                seen.add(cell)
-
-                # recursively try to add all neighbours of the current cell to the current group
-                for neighbour in self.game._get_neighbours(cell[0], cell[1]):
-                    
-                    group(neighbour, current_group, cell)
-
-        
-        groups = []
-        # iterate over all cells and try to add them to a new group. during the group() call, the group will expand to 
-        # include all the cells that have at least one common closed neighbour with the starting cell
-        for x in range(self.game.width):
-            for y in range(self.game.height):
-                grp = []
-                group((x, y), grp, None)
-
-                if len(grp) > 0:
-                    groups.append(grp)
-
-        return groups
+        return safe, mines, actions
+
+    def ground_groups(self, groups, group_ids, marked):
+        """Grounds the given groups in a new program, tagged with their ids, together with the facts of the marked cells."""
+        with self.profile.phase('facts'):
+            self.reset()
+            self.ctl.add('\n'.join(self.group_facts(groups, group_ids) + marked))
+
+        with self.profile.phase('grounding'):
+            self.ctl.ground()
+
+    def group_facts(self, groups, group_ids):
+        """Returns the facts describing the given groups, tagged with their ids."""
+        facts = []
+        for group_id in group_ids:
+            group, group_asked = groups[group_id]
+            facts.append(f'group({group_id}).')
+
+            for x, y in group:
+                facts.append(f'number({group_id}, {x + 1}, {y + 1}, {int(self.game.field[x, y])}).')
+
+            for asked_x, asked_y in group_asked:
+                facts.append(f'asked({group_id}, {asked_x + 1}, {asked_y + 1}).')
+
+        return facts
+
+    def marked_facts(self):
+        return [f'flagged({x + 1}, {y + 1}).' for x, y in np.argwhere(self.game.marked == 1)]
+
+    def _group_deadline(self, deadline, groups_left):
+        """Splits the time left until the deadline evenly among the groups still to solve."""
+        if deadline is None:
+            return None
+
+        return time.time() + max(0, deadline - time.time()) / groups_left
+
+    def certain_cells(self, unsolved, solved, deadline=None):
+        """
+            Returns (safe, bombs): the cells that are safe and that are bombs in every answer set of their group.
+            The unsolved groups are checked without enumerating any answer sets, the solved ones (cells, bombs, model count, exact) by their counts.
+        """
+        safe_cells, bombs = self.proven_cells(solved)
+
+        for i, group_id in enumerate(unsolved):
+            active = Function('active', [Number(group_id)])
+            self.ctl.assign_external(active, True)
+            consequences = cautious_consequences(self.ctl, self._group_deadline(deadline, len(unsolved) - i), self.profile)
+            self.ctl.assign_external(active, False)
+
+            if consequences is not None:
+                safe_cells += [(x - 1, y - 1) for x, y in consequences[0]]
+                bombs += [(x - 1, y - 1) for x, y in consequences[1]]
+
+        return sorted(safe_cells), sorted(bombs)
+
+    @staticmethod
+    def proven_cells(solved):
+        """Returns (safe, bombs): the cells of the given solved groups (cells, bombs, model count, exact) that are safe and bombs in every model."""
+        safe_cells = []
+        bombs = []
+
+        # only if all models were seen, a cell is proven
+        for cells, cell_bombs, model_count, exact in solved:
+            if exact and model_count > 0:
+                safe_cells += [cell for cell in cells if cell_bombs.get(cell, 0) == 0]
+                bombs += [cell for cell in cells if cell_bombs.get(cell, 0) == model_count]
+
+        return safe_cells, bombs
+
+    def solve_group(self, group_id, deadline=None):
+        """
+            Enumerates the models of the given (already grounded) group only, by solving with just this group active.
+            If a deadline is given, the enumeration stops there and the counts only cover the models found so far.
+            Returns (bombs, model_count, exact), where bombs maps every cell (starting at 0) to the number of models it is a bomb in.
+        """
+        active = Function('active', [Number(group_id)])
+        self.ctl.assign_external(active, True)
+        _, bombs, model_count, exact = count_models(self.ctl, deadline, self.profile)
+        self.ctl.assign_external(active, False)
+
+        return {(x - 1, y - 1): count for (x, y), count in bombs.items()}, model_count, exact
+
+    def group_action(self, cells, bombs, model_count, exact):
+        """Returns the best action of a solved group (in clingo coordinates), or None."""
+        self.last_exact = self.last_exact and exact
+
+        if model_count == 0:
+            return
+
+        # select the cell that is a bomb in the fewest models
+        # at best, it is one that is a bomb in none of them, which would make this action 100% safe
+        best_action = min(cells, key=lambda cell: bombs.get(cell, 0))
+        if bombs.get(best_action, 0) == model_count:
+            return
+
+        return (best_action[0] + 1, best_action[1] + 1), 1 - bombs.get(best_action, 0) / model_count, exact
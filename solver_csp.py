@@ -1,60 +1,236 @@
 import logging
 import time
+from math import comb
 
 import numpy as np
 import cpmpy
+from cpmpy.solvers.solver_interface import ExitStatus
+from ortools.sat.python import cp_model
 
 from minesweeper import Minesweeper
+from solver_base import Solver
+from profiling import NULL_PROFILER
 
-class CSPSolver:
-    def __init__(self, game):
+
+def number_constraints(game, numbers):
+    """Returns the constraint of every given number: its closed neighbours hold as many mines as it has unmarked mines around."""
+    constraints = []
+
+    for x, y in numbers:
+        neighbours = list(game._get_neighbours(x, y))
+        closed = [cell for cell in neighbours if game.is_closed(*cell)]
+        marked = sum(1 for cell in neighbours if game.is_marked(*cell))
+
+        constraints.append((closed, int(game.field[x, y]) - marked))
+
+    return constraints
+
+def cell_classes(cells, constraints):
+    """Returns the classes of cells that neighbour exactly the same numbers, as (indices of these constraints, cells) pairs."""
+    touching = {cell: [] for cell in cells}
+    for c, (neighbours, _) in enumerate(constraints):
+        for cell in neighbours:
+            touching[cell].append(c)
+
+    classes = {}
+    for cell in cells:
+        classes.setdefault(tuple(touching[cell]), []).append(cell)
+
+    return list(classes.items())
+
+def count_models(cells, constraints, time_limit=None, profile=NULL_PROFILER):
+    """
+        Counts the models of the given closed cells and in how many of them every cell is a mine.
+        The cells of a class (see cell_classes()) are interchangeable, so every class is a single integer variable holding
+        its number of mines, and a solution that puts k mines into a class of n cells stands for comb(n, k) models.
+        constraints: list of (closed neighbours, number of mines among them), one per number
+        Returns (bomb_count, model_count, exact), where exact tells whether all models were counted.
+    """
+    with profile.phase('constraints'):
+        classes = cell_classes(cells, constraints)
+
+        # the solver and variables it should assign
+        solver = cpmpy.SolverLookup.get('ortools')
+        variables = [cpmpy.intvar(0, len(members)) for _, members in classes]
+
+        class_variables = [[] for _ in constraints]
+        for (touching, _), variable in zip(classes, variables):
+            for c in touching:
+                class_variables[c].append(variable)
+
+        for (_, mines), summands in zip(constraints, class_variables):
+            solver += sum(summands) == mines
+
+    # ask the solver to provide all solutions (or as many as it finds within the time limit), counted by a native callback
+    with profile.phase('search'):
+        counter = MineCounter(solver.solver_vars(variables), [len(members) for _, members in classes], profile)
+        solver.solve(time_limit=time_limit, solution_callback=counter, enumerate_all_solutions=True)
+        exact = solver.status().exitstatus in (ExitStatus.OPTIMAL, ExitStatus.UNSATISFIABLE)
+
+    profile.count('cpmpy_solves')
+    profile.count('solutions', counter.solution_count)
+
+    bomb_count = {cell: count for (_, members), count in zip(classes, counter.counts) for cell in members}
+    model_count = counter.model_count
+
+    # if not even a single solution was found in time, look for one without a time limit (and take its first cells as mines)
+    if model_count == 0 and not exact and solver.solve(enumerate_all_solutions=False, max_time_in_seconds=float('inf')):
+        profile.count('cpmpy_solves')
+        bomb_count = {cell: int(i < variable.value()) for (_, members), variable in zip(classes, variables)
+                      for i, cell in enumerate(members)}
+        model_count = 1
+
+    return bomb_count, model_count, exact
+
+
+class MineCounter(cp_model.CpSolverSolutionCallback):
+    """
+        Solution callback of OR-tools that counts the models and, for every given variable, the models a cell of its class
+        is a mine in. Every variable holds the number of mines of a class of interchangeable cells of the given size
+        (a single cell by default). Only the given variables are read, without going through cpmpy.
+    """
+
+    def __init__(self, variables, sizes=None, profile=NULL_PROFILER):
+        super().__init__()
+        self.variables = variables  # OR-tools variables
+        self.sizes = sizes if sizes is not None else [1] * len(variables)
+        self.profile = profile
+        self.counts = [0] * len(variables)
+        self.solution_count = 0
+        self.model_count = 0
+
+    def on_solution_callback(self):
+        with self.profile.phase('models'):
+            self._count_solution()
+
+    def _count_solution(self):
+        values = [self.value(variable) for variable in self.variables]
+
+        # the number of ways to place the mines of every class among its cells
+        models = 1
+        for size, value in zip(self.sizes, values):
+            if 0 < value < size:
+                models *= comb(size, value)
+
+        self.solution_count += 1
+        self.model_count += models
+
+        # a single cell of a class of n cells with k mines is a mine in k / n of these models
+        for i, (size, value) in enumerate(zip(self.sizes, values)):
+            if value:
+                self.counts[i] += models * value // size
+
+
+class CSPSolver(Solver):
+    def __init__(self, game, step_budget=None, compress=True):
         self.game = game
-        
-
-    def solve_step(self):
-        visible_field = self.game.get_visible_field()
-
-        # the model and variables the solver should assign
-        model = cpmpy.Model()
-        mines = cpmpy.boolvar(shape=visible_field.shape) # 2d boolean variable array, saying if cell (x, y) contains a mine
-
-        for x in range(self.game.width):
-            for y in range(self.game.height):
-                cell = visible_field[x, y]
-
-                # cell has been marked as a bomb previously, so provide this as a fact to the solver
-                if cell == -3:
-                    model += mines[x, y] == 1
-
-                # cell is a number, which means we want to add the constraint, that the sum of neighbouring mines should be equal to the number value
-                if cell >= 0:
-                    model += mines[x, y] == 0  # cell is a number, so it cannot be a mine
-                    model += sum(mines[nx, ny] for nx, ny in self.game._get_neighbours(x, y)) == int(visible_field[x, y])        
-
-        # helper variable to count how often a cell was set to a bomb over all models
-        self.bomb_count = np.zeros(visible_field.shape)
-        self.model_counter = 0
-
-        # callback for a found model
-        def handle_result():
-            self.bomb_count += np.array(mines.value(), dtype=np.float64) # casting needed to convert Boolean variables to numbers for summation
-            self.model_counter += 1
-
-        # ask the solver to provide all models
-        model.solveAll(display=handle_result)
-
-        # go over each cell and check if it was set to a bomb in every model
-        # if it was, we can safely mark it as bomb
-        for x in range(self.game.width):
-            for y in range(self.game.height):
-                if self.bomb_count[x, y] >= self.model_counter:
-                    self.game.mark(x, y)
-
-        # set all cells with already known cells to inf
-        filtered = np.where(visible_field >= 0, np.inf, self.bomb_count)
-        # set all cells that resulted in NaN due to the solver not assigning a value since the cell had no constraint
-        filtered = np.where(np.isnan(filtered), np.inf, filtered)
-        # find out the cell index which contained least often a bomb over all models (most safe cell to open)
-        safest_cell = np.unravel_index(np.argmin(filtered), visible_field.shape)
-        
-        return safest_cell
+        self.step_budget = step_budget  # time in seconds a step may take at most, after which the models seen so far are used
+        self.last_exact = True  # whether the last step was based on all models (or on the ones found within the budget)
+        self.safe_cells = []  # cells proven to be safe, that have not been opened yet
+        self.compress = compress  # whether to count the classes of interchangeable frontier cells (see count_models()) instead of single cells
+
+        # without compression, the solver keeps its constraints between steps, every step only adds the ones of the cells
+        # revealed since the last step (the classes of interchangeable cells change with every step, so they are counted anew)
+        if not compress:
+            self.solver = cpmpy.SolverLookup.get('ortools')
+            self.mines = cpmpy.boolvar(shape=(game.width, game.height)) # 2d boolean variable array, saying if cell (x, y) contains a mine
+            self.known = np.zeros((game.width, game.height), dtype=bool)  # cells that were not closed anymore at the last update
+            self.constrained = np.zeros((game.width, game.height), dtype=bool)  # cells whose variable is part of a constraint
+
+
+    def update_model(self):
+        """Adds the constraints of the numbers revealed since the last step and fixes the cells that are not closed anymore."""
+        game = self.game
+
+        revealed = ((game.explored == 1) | (game.marked == 1)) & ~self.known
+        self.known |= revealed
+
+        # constrained cells that got opened contain no mine, the marked ones do
+        for x, y in np.argwhere(revealed & self.constrained):
+            self.solver += self.mines[x, y] == int(game.is_marked(x, y))
+
+        # a new number constrains its closed neighbours, its opened and marked neighbours are already known
+        # (numbers without closed neighbours do not constrain anything, neither now nor later)
+        for x, y in np.argwhere(revealed & (game.explored == 1) & (game.marked == 0)):
+            if game.field[x, y] < 0:
+                continue
+
+            neighbours = list(game._get_neighbours(x, y))
+            closed = [cell for cell in neighbours if game.is_closed(*cell)]
+            if len(closed) == 0:
+                continue
+
+            self.solver += sum(self.mines[cell] for cell in closed) == \
+                           int(game.field[x, y]) - sum(1 for cell in neighbours if game.is_marked(*cell))
+
+            for cell in closed:
+                self.constrained[cell] = True
+
+    def solve_batch(self):
+        deadline = None if self.step_budget is None else time.time() + self.step_budget
+
+        # only the closed cells of the frontier are counted
+        cells = sorted(self.game.frontier_closed)
+        time_limit = None if deadline is None else max(0.001, deadline - time.time())  # the solver needs a positive time limit
+
+        if self.compress:
+            with self.profile.phase('constraints'):
+                constraints = number_constraints(self.game, self.game.frontier_numbers)
+
+            bomb_count, model_count, self.last_exact = count_models(cells, constraints, time_limit, self.profile)
+        else:
+            bomb_count, model_count, self.last_exact = self.count_cell_models(cells, time_limit)
+
+        # a cell that is a bomb in none or all of the models is safe or a bomb (which is only proven if all models were seen)
+        if self.last_exact and model_count > 0:
+            safe = [cell for cell in cells if bomb_count[cell] == 0]
+            mines = [cell for cell in cells if bomb_count[cell] == model_count]
+
+            if len(safe) > 0:
+                return safe, mines, None
+        else:
+            mines = []
+
+        # a cell that is a bomb in all models is never guessed, even if not all models were seen
+        candidates = [cell for cell in cells if bomb_count[cell] < model_count]
+
+        if model_count == 0 or len(candidates) == 0:
+            return [], mines, self.any_closed_cell(mines)
+
+        # the cell which contained least often a bomb over all models (most safe cell to open)
+        safest_cell = min(candidates, key=lambda cell: bomb_count[cell])
+
+        return [], mines, safest_cell
+
+    def count_cell_models(self, cells, time_limit=None):
+        """Counts the models of the given frontier cells one cell at a time, with the model kept between steps. Returns like count_models()."""
+        with self.profile.phase('constraints'):
+            self.update_model()
+
+        # ask the solver to provide all models (or as many as it finds within the budget), all other variables are fixed
+        with self.profile.phase('search'):
+            counter = MineCounter(self.solver.solver_vars([self.mines[cell] for cell in cells]), profile=self.profile)
+            self.solver.solve(time_limit=time_limit, solution_callback=counter, enumerate_all_solutions=True)
+            exact = self.solver.status().exitstatus in (ExitStatus.OPTIMAL, ExitStatus.UNSATISFIABLE)
+
+        self.profile.count('cpmpy_solves')
+        self.profile.count('solutions', counter.solution_count)
+
+        bomb_count = dict(zip(cells, counter.counts))
+        model_count = counter.model_count
+
+        # if not even a single model was found within the budget, look for one without a time limit
+        # (the parameters of the solver stay set between calls, so they are reset explicitly)
+        if model_count == 0 and not exact and self.solver.solve(enumerate_all_solutions=False, max_time_in_seconds=float('inf')):
+            self.profile.count('cpmpy_solves')
+            bomb_count = {cell: int(self.mines[cell].value()) for cell in cells}
+            model_count = 1
+
+        return bomb_count, model_count, exact
+
+
+class PersistentCSPSolver(CSPSolver):
+    """CSPSolver that keeps its model between steps and counts single cells instead of classes of interchangeable cells."""
+
+    def __init__(self, game, step_budget=None):
+        super().__init__(game, step_budget, compress=False)
@@ -3,147 +3,109 @@ import time
 
 import numpy as np
 import cpmpy
+from cpmpy.solvers.solver_interface import ExitStatus
 
 from minesweeper import Minesweeper
+from grouping import FrontierGrouping
+from solver_csp import count_models, number_constraints
+from solver_base import Solver
+import component_cache
+import worker_pool
 
-class CSPSolverGrouped:
-    def __init__(self, game):
-        self.game = game
-
-    def solve_step(self):
-        best_actions = self.solve_groups()
-        best_action = min(best_actions, key=lambda a: a[1])[0]
-
-        return best_action
-
-    def solve_groups(self):
-        actions = []
-
-        # get groups
-        groups = self.find_unopened_groups()
-
-        for group in groups:
-            group_asked = []
-
-            for cell in group:
-                group_asked += self.game._get_closed_neighbours(*cell)
 
-            group_asked = list(set(group_asked))
-
-            best_group_action = self.solve_group(group_asked, group)
-            if best_group_action is not None:
-                actions.append(best_group_action)
-
-        return actions
-
-
-    def solve_group(self, asked_for, knowns):
-        visible_field = self.game.get_visible_field()
-
-        # the model and variables the solver should assign
-        model = cpmpy.Model()
+class CSPSolverGrouped(Solver):
+    def __init__(self, game, step_budget=None, cache=None, workers=None, inline_size=12):
+        self.game = game
+        self.grouping = FrontierGrouping(game)
+        self.cache = cache if cache is not None else component_cache.shared  # groups solved before, in this or other games
+        self.step_budget = step_budget  # time in seconds a step may take at most, shared evenly by the groups
+        self.last_exact = True  # whether the last step was based on all models of every group
+        self.safe_cells = []  # cells proven to be safe, that have not been opened yet
+        self.workers = workers  # number of worker processes to solve groups in parallel (None to solve all groups here)
+        self.inline_size = inline_size  # groups with fewer closed cells are not worth sending to a worker
 
-        variables = {}
-        self.bomb_count = {}
-        self.model_counter = 0
-        
-        for x, y in asked_for:
-            variables[(x, y)] = cpmpy.boolvar()
-            self.bomb_count[(x, y)] = 0
+    def solve_batch(self):
+        safe, mines, actions = self.solve_groups()
+        if len(safe) > 0:
+            return safe, mines, None
 
-        for x, y in knowns:
-            model += (sum(variables[(nx, ny)] for nx, ny in self.game._get_neighbours(x, y) if (nx, ny) in variables) + \
-                     (sum(1 for nx, ny in self.game._get_neighbours(x, y) if visible_field[nx, ny] == -3)) \
-                       == int(visible_field[x, y]))
+        if len(actions) == 0:
+            return [], mines, self.any_closed_cell(mines)
 
+        best_action = min(actions, key=lambda a: a[1])[0]
 
-        # callback for a found model
-        def handle_result():
-            for x, y in variables.keys():
-                if variables[(x, y)].value():
-                    self.bomb_count[(x, y)] += 1 
+        return [], mines, best_action
 
-            self.model_counter += 1
+    def solve_groups(self):
+        """
+            Returns (safe, mines, actions): the cells proven to be safe and to be mines, and the safest cell of every group
+            as (cell, probability of being a mine).
+        """
+        safe = []
+        mines = []
+        actions = []
+        deadline = None if self.step_budget is None else time.time() + self.step_budget
+        self.last_exact = True
 
-        # ask the solver to provide all models
-        models = model.solveAll(display=handle_result)
+        # get groups of numbers together with the closed cells around them
+        with self.profile.phase('grouping'):
+            groups = self.grouping.groups()
 
-        if self.model_counter <= 0:
-            return
+        # groups solved before (up to translation, rotation and reflection) do not need to be solved again
+        results = {}  # group index -> (bomb count, model count, exact)
+        unsolved = []
 
-        safest_cell = min(self.bomb_count, key=self.bomb_count.get)
-        safest_cell_occ = self.bomb_count[safest_cell]
+        with self.profile.phase('cache'):
+            for i, (group, group_asked) in enumerate(groups):
+                key, cells = component_cache.group_key(self.game, group, group_asked)
+                cached = self.cache.get(key)
 
-        return safest_cell, safest_cell_occ / self.model_counter
+                if cached is not None:
+                    bombs = dict(zip(cells, cached[1]))
+                    results[i] = ({cell: bombs[cell] for cell in group_asked}, cached[0], True)
+                else:
+                    unsolved.append((i, key, cells))
 
+        def constraints(i):
+            with self.profile.phase('constraints'):
+                return number_constraints(self.game, groups[i][0])
 
-    def find_unopened_groups(self):
-        visible_field = self.game.get_visible_field()
-        
-        seen = set()
+        def time_limit(group_deadline):
+            # the solver needs a positive time limit
+            return None if group_deadline is None else max(0.001, group_deadline - time.time())
 
-        def is_open(cell):
-                cv = visible_field[cell[0], cell[1]]
-                return cv != -2 or self.game.marked[cell[0], cell[1]] == 1
-        def is_closed(cell):
-            return not is_open(cell)
+        def solve_here(i, group_deadline):
+            return count_models(groups[i][1], constraints(i), time_limit(group_deadline), self.profile)
 
-        def hasCommonClosedNeighbour(cell1, cell2):    
-            neighbours1 = set(filter(is_closed, self.game._get_neighbours(cell1[0], cell1[1])))
-            neighbours2 = set(filter(is_closed, self.game._get_neighbours(cell2[0], cell2[1])))
+        def worker_task(i, group_deadline):
+            return count_models, groups[i][1], constraints(i), time_limit(group_deadline)
 
-            intersection = neighbours1.intersection(neighbours2)
+        solved = worker_pool.solve_groups(groups, [i for i, _, _ in unsolved], solve_here, worker_task, self.workers, self.inline_size, deadline, self.profile)
 
-            return len(intersection) > 0
+        for i, key, cells in unsolved:
+            bomb_count, model_count, exact = solved[i]
+            self.last_exact = self.last_exact and exact
 
-        def hasClosedNeighbours(cell):
-            return len(list(filter(is_closed, self.game._get_neighbours(cell[0], cell[1])))) > 0
+            # only complete results may be reused
+            if exact:
+                self.cache.put(key, (model_count, tuple(bomb_count[cell] for cell in cells)))
 
-        def group(cell, current_group, last_cell):
-            cv = visible_field[cell[0], cell[1]]
+            results[i] = (bomb_count, model_count, exact)
 
-            if cv == -2:
-                # if not (self.game.is_closed(*cell) and self.game.is_closed(*last))
-                for neighbour in self.game._get_neighbours(cell[0], cell[1]):
-                    
-                    if not (self.game.is_closed(*cell) and self.game.is_closed(*neighbour)):
-                        group(neighbour, current_group, cell)
-            else:
-                # ignore cells without unknown neighbours, since they won't contribute to the search in any way
-                if not hasClosedNeighbours(cell):
-                    return
+        for i in range(len(groups)):
+            bomb_count, model_count, exact = results[i]
 
-                # ignore cells that do not have any mines as neighbours (which again wont contribute to search)
-                # ignore cells that have been already visited as a stop condition for the recursion
-                # ignore cells that have been marked (which in our case means, that the AI is sure there is a mine)
-                if cv == 0 or cell in seen or self.game.marked[cell[0], cell[1]] == 1:
-                    return
-                
-                # also stop, if this has been a recursive call (last_cell != None) but there are no common closed 
-                # neighbours between the last_cell and the current cell (which means they should NOT be in the same group)
-                if last_cell is not None and visible_field[last_cell[0], last_cell[1]] != -2 and not hasCommonClosedNeighbour(cell, last_cell):
-                    return
+            if model_count <= 0:
+                continue
 
-                # so if current is not unknown (we do not want unknowns in the group) and current and last cells have at least 
-                # one common closed neighbour, we can expand the current group with the current cell and mark the current cell as seen
-                current_group.append(cell)
-                seen.add(cell)
+            # a cell that is a mine in none or all of the models is proven (only if all models were seen)
+            if exact:
+                safe += [cell for cell in groups[i][1] if bomb_count[cell] == 0]
+                mines += [cell for cell in groups[i][1] if bomb_count[cell] == model_count]
 
-                # recursively try to add all neighbours of the current cell to the current group
-                for neighbour in self.game._get_neighbours(cell[0], cell[1]):
-                    
-                    group(neighbour, current_group, cell)
+            # a group whose cells are all mines in every model has no cell worth guessing
+            safest_cell = min(bomb_count, key=bomb_count.get)
+            if bomb_count[safest_cell] < model_count:
+                actions.append((safest_cell, bomb_count[safest_cell] / model_count))
 
-        
-        groups = []
-        # iterate over all cells and try to add them to a new group. during the group() call, the group will expand to 
-        # include all the cells that have at least one common closed neighbour with the starting cell
-        for x in range(self.game.width):
-            for y in range(self.game.height):
-                grp = []
-                group((x, y), grp, None)
-
-                if len(grp) > 0:
-                    groups.append(grp)
-
-        return groups
\ No newline at end of file
+        return sorted(safe), sorted(mines), actions
@@ -0,0 +1,315 @@
+import logging
+import time
+from math import lgamma
+
+import numpy as np
+
+from minesweeper import Minesweeper
+from grouping import FrontierGrouping
+from solver_base import Solver
+
+
+def poly_mul(a, b):
+    """Multiplies two polynomials given as lists of coefficients (counts indexed by number of mines)."""
+    result = [0] * (len(a) + len(b) - 1)
+
+    for i, ca in enumerate(a):
+        if ca:
+            for j, cb in enumerate(b):
+                result[i + j] += ca * cb
+
+    return result
+
+def poly_add(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+
+    result = list(a)
+    for i, cb in enumerate(b):
+        result[i] += cb
+
+    return result
+
+
+class ComponentCounter:
+    """
+        Counts the solutions of a single group of numbers, without enumerating them.
+
+        The closed cells of the group are decided one after the other. The state after deciding a prefix of the cells
+        only consists of the number of mines still needed by the numbers that have decided and undecided neighbours,
+        so solutions sharing a state are counted together (a forward and a backward pass over these states).
+        All counts are polynomials over the number of mines in the group, as exact integers.
+    """
+
+    def __init__(self, cells, constraints):
+        """
+            cells: the closed cells of the group
+            constraints: list of (neighbouring closed cells, number of mines among them), one per number of the group
+        """
+        self.cells = self._order(cells, constraints)
+        index = {cell: i for i, cell in enumerate(self.cells)}
+
+        n = len(self.cells)
+        self.first = []  # index of the first cell of every constraint
+        self.last = []  # index of the last cell of every constraint
+        self.needed = []
+        self.cell_constraints = [[] for _ in range(n)]
+
+        for c, (neighbours, needed) in enumerate(constraints):
+            indices = sorted(index[cell] for cell in neighbours)
+            self.first.append(indices[0])
+            self.last.append(indices[-1])
+            self.needed.append(needed)
+
+            for i in indices:
+                self.cell_constraints[i].append(c)
+
+        # the constraints that are only partly decided before every cell, and how many of their cells are still undecided
+        self.active = [[] for _ in range(n + 1)]
+        for c in range(len(constraints)):
+            for i in range(self.first[c] + 1, self.last[c] + 1):
+                self.active[i].append(c)
+
+        self.undecided = [[0] * len(constraints) for _ in range(n + 1)]
+        for i in range(n - 1, -1, -1):
+            self.undecided[i] = list(self.undecided[i + 1])
+            for c in self.cell_constraints[i]:
+                self.undecided[i][c] += 1
+
+    @staticmethod
+    def _order(cells, constraints):
+        """Orders the cells breadth first along shared constraints, which keeps the number of partly decided constraints small."""
+        adjacent = {cell: set() for cell in cells}
+        for neighbours, _ in constraints:
+            for cell in neighbours:
+                adjacent[cell].update(neighbours)
+
+        order = []
+        seen = set()
+
+        for start in sorted(cells):
+            if start in seen:
+                continue
+
+            seen.add(start)
+            queue = [start]
+
+            for cell in queue:
+                order.append(cell)
+
+                for neighbour in sorted(adjacent[cell] - seen):
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+
+        return order
+
+    def _step(self, i, state, mine):
+        """Returns the state after deciding cell i, or None if deciding it this way violates a constraint."""
+        needed = dict(zip(self.active[i], state))
+
+        for c in self.cell_constraints[i]:
+            remaining = (needed[c] if c in needed else self.needed[c]) - mine
+
+            # the mines still needed have to fit into the cells still undecided
+            if remaining < 0 or remaining > self.undecided[i + 1][c]:
+                return None
+
+            needed[c] = remaining
+
+        return tuple(needed[c] for c in self.active[i + 1])
+
+    def count(self):
+        """
+            Returns (total, cell_totals): the number of solutions by number of mines, and for every cell the number of
+            solutions by number of mines in which this cell is a mine.
+        """
+        n = len(self.cells)
+
+        # forward pass: number of ways to reach a state by number of mines placed so far
+        forward = [{} for _ in range(n + 1)]
+        forward[0][()] = [1]
+        transitions = [[] for _ in range(n)]
+
+        for i in range(n):
+            for state, ways in forward[i].items():
+                for mine in (0, 1):
+                    next_state = self._step(i, state, mine)
+                    if next_state is None:
+                        continue
+
+                    shifted = [0] + ways if mine else ways
+                    forward[i + 1][next_state] = poly_add(forward[i + 1].get(next_state, []), shifted)
+                    transitions[i].append((state, mine, next_state))
+
+        # backward pass: number of ways to complete the solution from a state by number of mines placed from there on
+        backward = [{} for _ in range(n + 1)]
+        backward[n][()] = [1]
+
+        for i in range(n - 1, -1, -1):
+            for state, mine, next_state in transitions[i]:
+                if next_state in backward[i + 1]:
+                    ways = backward[i + 1][next_state]
+                    backward[i][state] = poly_add(backward[i].get(state, []), [0] + ways if mine else ways)
+
+        total = backward[0].get((), [0])
+
+        cell_totals = {}
+        for i, cell in enumerate(self.cells):
+            mine_ways = [0]
+
+            for state, mine, next_state in transitions[i]:
+                if mine and next_state in backward[i + 1]:
+                    mine_ways = poly_add(mine_ways, poly_mul(forward[i][state], [0] + backward[i + 1][next_state]))
+
+            cell_totals[cell] = mine_ways
+
+        return total, cell_totals
+
+
+class ProbabilitySolver(Solver):
+    """
+        Computes the exact mine probability of every closed cell by counting solutions instead of enumerating them.
+        Every group of the frontier is counted separately, by number of mines, and the groups are combined taking into
+        account in how many ways the remaining mines can be distributed over the closed cells not touching any number.
+    """
+
+    def __init__(self, game, step_budget=None):
+        self.game = game
+        self.grouping = FrontierGrouping(game)
+        self.step_budget = step_budget  # not needed, as counting does not enumerate any solutions
+        self.last_exact = True
+        self.safe_cells = []  # cells proven to be safe, that have not been opened yet
+
+    def solve_batch(self):
+        probabilities = self.get_probabilities()
+        closed = (self.game.explored == 0) & (self.game.marked == 0)
+
+        # the cells that are safe and mines in every solution
+        safe = [(int(x), int(y)) for x, y in np.argwhere(closed & (probabilities == 0))]
+        mines = [(int(x), int(y)) for x, y in np.argwhere(closed & (probabilities == 1))]
+
+        if len(safe) > 0:
+            return safe, mines, None
+
+        # open the cell that is the least likely to be a mine
+        candidates = np.where(closed & (probabilities < 1), probabilities, np.inf)
+        if not np.isfinite(candidates).any():
+            return [], mines, self.any_closed_cell(mines)
+
+        safest_cell = np.unravel_index(np.argmin(candidates), candidates.shape)
+
+        return [], mines, (int(safest_cell[0]), int(safest_cell[1]))
+
+    def get_probabilities(self):
+        """Returns the mine probability of every cell (1 for marked cells, NaN for opened cells)."""
+        game = self.game
+
+        with self.profile.phase('grouping'):
+            groups = self.grouping.groups()
+
+        # count the solutions of every group, exactly
+        group_totals = []
+        group_cell_totals = []
+
+        for numbers, closed in groups:
+            constraints = []
+            for x, y in numbers:
+                neighbours = [cell for cell in game._get_neighbours(x, y) if game.is_closed(*cell)]
+                marked = sum(1 for cell in game._get_neighbours(x, y) if game.is_marked(*cell))
+
+                constraints.append((neighbours, int(game.field[x, y]) - marked))
+
+            with self.profile.phase('counting'):
+                total, cell_totals = ComponentCounter(closed, constraints).count()
+            group_totals.append(total)
+            group_cell_totals.append(cell_totals)
+
+        closed_mask = (game.explored == 0) & (game.marked == 0)
+        interior = int(closed_mask.sum()) - sum(len(closed) for _, closed in groups)
+        mines_left = game.mines - game.marked_counter
+
+        probabilities = np.where(game.marked == 1, 1.0, np.where(game.explored == 1, np.nan, 0.0))
+
+        # the counts only serve as weights from here on, so they are scaled to floats of at most 1
+        scaled_totals = [np.array([ways / max(total) for ways in total]) for total in group_totals]
+
+        # products of all group polynomials before and after every group, so the polynomial of all other groups is cheap
+        # (every product is scaled again, the scale cancels out since every probability is a ratio of sums over the same product)
+        prefix = [np.ones(1)]
+        for total in scaled_totals:
+            product = np.convolve(prefix[-1], total)
+            prefix.append(product / product.max())
+
+        suffix = [np.ones(1)]
+        for total in reversed(scaled_totals):
+            product = np.convolve(suffix[-1], total)
+            suffix.append(product / product.max())
+        suffix.reverse()
+
+        # which numbers of mines the groups can hold together, known exactly
+        supports = [np.array(total) > 0 for total in group_totals]
+
+        weights, feasible = self._interior_weights(interior, mines_left, len(prefix[-1]))
+
+        all_groups = prefix[-1]
+        solutions = all_groups @ weights
+
+        if solutions == 0:
+            logging.warning('the visible field has no solution')
+            return probabilities
+
+        # the interior cells all have the same probability
+        if interior > 0:
+            interior_mines = (all_groups * weights) @ (mines_left - np.arange(len(weights)))
+            probabilities[closed_mask] = interior_mines / (solutions * interior)
+
+        for i, (total, cell_totals) in enumerate(zip(group_totals, group_cell_totals)):
+            others = np.convolve(prefix[i], suffix[i + 1])
+            others_support = np.convolve(self._support(supports[:i]), self._support(supports[i + 1:])) > 0.5
+
+            # weight of the other groups and the interior, given the number of mines in this group
+            others_weight = np.array([others @ weights[own:own + len(others)] for own in range(len(total))])
+            group_solutions = scaled_totals[i] @ others_weight
+
+            # the numbers of mines this group can hold in any solution of the whole field
+            possible = [own for own in range(len(total))
+                        if total[own] > 0 and np.any(others_support & feasible[own:own + len(others_support)])]
+
+            for cell, mine_ways in cell_totals.items():
+                mine_ways = mine_ways + [0] * (len(total) - len(mine_ways))
+
+                # decide exactly whether a cell is a mine in all or none of the solutions
+                if all(mine_ways[own] == total[own] for own in possible):
+                    probabilities[cell] = 1.0
+                elif all(mine_ways[own] == 0 for own in possible):
+                    probabilities[cell] = 0.0
+                else:
+                    probabilities[cell] = np.array([ways / max(total) for ways in mine_ways]) @ others_weight / group_solutions
+
+        return probabilities
+
+    @staticmethod
+    def _support(supports):
+        """Returns for every number of mines whether the given groups can hold that many mines together (as floats of 0 and 1)."""
+        support = np.ones(1)
+        for group_support in supports:
+            support = np.minimum(np.convolve(support, group_support), 1)
+
+        return support
+
+    @staticmethod
+    def _interior_weights(interior, mines_left, length):
+        """
+            Returns for every number of mines placed on the groups the number of ways to place the rest on the interior cells,
+            scaled to a maximum of 1, and whether the rest can be placed there at all.
+        """
+        rest = mines_left - np.arange(length)
+        feasible = (rest >= 0) & (rest <= interior)
+
+        log_weights = np.full(length, -np.inf)
+        log_weights[feasible] = [lgamma(interior + 1) - lgamma(r + 1) - lgamma(interior - r + 1) for r in rest[feasible]]
+
+        if not feasible.any():
+            return np.zeros(length), feasible
+
+        return np.exp(log_weights - log_weights.max()), feasible
@@ -0,0 +1,34 @@
+"""Checks storing the component cache on disk."""
+
+import json
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from component_cache import ComponentCache, canonical_form
+
+
+def test_entries_survive_saving_and_loading(tmp_path):
+    cache = ComponentCache()
+
+    key, _ = canonical_form([((1, 1), 2), ((2, 1), 1)], [(0, 0), (1, 0), (2, 0), (3, 0)])
+    cache.put(key, (3, (1, 2, 1, 2)))
+
+    # counts of big groups exceed 64 bits
+    key, _ = canonical_form([((0, 1), 1)], [(0, 0), (1, 0)], bound=1)
+    cache.put(key, (2 ** 70, (2 ** 69, 2 ** 69)))
+
+    cache.save(str(tmp_path / 'components.json'))
+    loaded = ComponentCache(file=str(tmp_path / 'components.json'))
+
+    assert list(loaded.entries.items()) == list(cache.entries.items())
+
+def test_files_of_other_versions_are_ignored(tmp_path):
+    with open(tmp_path / 'components.json', 'w') as f:
+        json.dump({'format': 'minesweeper-component-cache', 'version': 1, 'entries': [[[None, [], []], [1, []]]]}, f)
+
+    with open(tmp_path / 'components.pkl', 'wb') as f:
+        f.write(b'\x80\x05\x95')
+
+    assert len(ComponentCache(file=str(tmp_path / 'components.json')).entries) == 0
+    assert len(ComponentCache(file=str(tmp_path / 'components.pkl')).entries) == 0
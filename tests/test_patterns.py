@@ -0,0 +1,20 @@
+"""Checks the pattern tables shipped in pattern-tables.npz."""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import patterns
+
+
+@pytest.mark.parametrize('offset', patterns.OFFSETS)
+def test_shipped_tables_are_up_to_date(offset):
+    assert os.path.exists(patterns.TABLE_FILE)
+
+    stored = patterns.load_tables()[offset]
+    built = patterns.build_table(offset)
+
+    for stored_table, built_table in zip(stored, built):
+        assert (stored_table == built_table).all()
@@ -0,0 +1,50 @@
+"""Checks the batches of every registered solver over whole games, played without trivial rules and patterns."""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+import component_cache
+import registry
+from minesweeper import Minesweeper
+from solver_base import apply_batch
+
+# (seed, board), the first game guessed a proven mine with clingo-grouped before
+GAMES = [(15, (30, 16, 99)), (0, (16, 16, 40)), (1, (16, 16, 40)), (2, (9, 9, 10))]
+
+
+def seeded_game(seed, board):
+    """Returns the game of the given seed with its first cell opened, as benchmark/benchmark.py plays it."""
+    width, height, mines = board
+
+    game = Minesweeper(width, height, mines, rng=np.random.default_rng(seed))
+    game.open(min(4, width - 1), min(4, height - 1))
+
+    return game
+
+def batches(solver):
+    """Plays the game of the solver to its end and yields every batch before it is applied."""
+    while not solver.game.is_done():
+        batch = solver.solve_batch()
+        yield batch
+
+        if apply_batch(solver.game, batch):
+            break
+
+@pytest.mark.parametrize('name', registry.names())
+@pytest.mark.parametrize('seed, board', GAMES)
+def test_batches(name, seed, board):
+    """The mines of a batch are closed cells, its guess is a closed cell that is not one of them."""
+    component_cache.shared = component_cache.ComponentCache()
+    solver = registry.get(name)(seeded_game(seed, board))
+
+    for safe, mines, guess in batches(solver):
+        assert all(solver.game.is_closed(*cell) for cell in mines)
+
+        if len(safe) == 0:
+            assert guess is not None
+            assert guess not in mines
+            assert solver.game.is_closed(*guess)
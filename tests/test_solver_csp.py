@@ -0,0 +1,29 @@
+"""Checks that the CSP solver finds the same batches with a persistent model as with a new compressed model every step."""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from solver_base import apply_batch
+from solver_csp import CSPSolver, PersistentCSPSolver
+from test_solve_batch import seeded_game
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_persistent_model_finds_the_same_batches(seed):
+    compressed = CSPSolver(seeded_game(seed, (16, 16, 40)))
+    persistent = PersistentCSPSolver(seeded_game(seed, (16, 16, 40)))
+
+    while not compressed.game.is_done():
+        batch = compressed.solve_batch()
+        safe, mines, guess = persistent.solve_batch()
+
+        assert (sorted(safe), sorted(mines), guess) == (sorted(batch[0]), sorted(batch[1]), batch[2])
+
+        lost = apply_batch(compressed.game, batch)
+        assert apply_batch(persistent.game, batch) == lost
+
+        if lost:
+            break
@@ -0,0 +1,201 @@
+"""
+Game traces and position snapshots, to benchmark the solvers on mid-game positions without playing whole games.
+
+A trace holds the seed and board of a game and everything a driver did to it: the solver calls, the cells it opened,
+marked or guessed and the rounds of trivial rules and patterns in between. These rules are deterministic, so a round is
+stored as a single event instead of the cells it changed. Every event takes five bytes, replaying a trace on a game of
+the same seed and board gives back every position of the game.
+
+A snapshot is a bit-packed position: the mines, the opened and the marked cells of the board (three bits per cell), the
+numbers follow from the mines. restore() turns it into a Minesweeper instance any solver can be run on, e.g.
+
+    solver = ProbabilitySolver(restore(snapshot))
+    cell = solver.solve_step()
+
+Position files hold many snapshots, see benchmark/positions.py for recording a corpus of hard positions and timing the
+solvers on it.
+"""
+
+import struct
+
+import numpy as np
+
+from minesweeper import Minesweeper, neighbour_sum, EXPLORED, MARKED
+from patterns import open_patterns
+
+TRACE_HEADER = b'MSTRACE\x01'
+POSITIONS_HEADER = b'MSPOSITIONS\x01'
+
+# kinds of trace events
+SOLVE = 0  # the solver is called on the current position
+OPEN = 1
+MARK = 2
+GUESS = 3  # a cell opened without being proven to be safe
+TRIVIAL = 4  # a round of Minesweeper.open_trivials()
+PATTERNS = 5  # a round of patterns.open_patterns(), x is 1 if it applied the trivial rules in between
+
+EVENT_DTYPE = np.dtype([('kind', 'u1'), ('x', '<u2'), ('y', '<u2')])
+
+# seed, width, height, mines
+BOARD_FORMAT = '<IHHI'
+
+
+class Trace:
+    """The seed and board of a game and the events of a driver playing it."""
+
+    def __init__(self, seed, width, height, mines):
+        self.seed = seed
+        self.width = width
+        self.height = height
+        self.mines = mines
+        self.events = []  # (kind, x, y), x and y are 0 for events without a cell
+
+    def open(self, x, y):
+        self.events.append((OPEN, x, y))
+
+    def mark(self, x, y):
+        self.events.append((MARK, x, y))
+
+    def solve(self):
+        self.events.append((SOLVE, 0, 0))
+
+    def trivial(self):
+        self.events.append((TRIVIAL, 0, 0))
+
+    def patterns(self, trivials=True):
+        self.events.append((PATTERNS, int(trivials), 0))
+
+    def batch(self, batch):
+        """Records a batch returned by Solver.solve_batch(), as applied by solver_base.apply_batch()."""
+        safe, mines, guess = batch
+
+        for cell in mines:
+            self.mark(*cell)
+
+        if len(safe) > 0:
+            for cell in safe:
+                self.open(*cell)
+        elif guess is not None:
+            self.events.append((GUESS, *guess))
+
+    def new_game(self):
+        """Returns the game of the trace before its first event."""
+        return Minesweeper(self.width, self.height, self.mines, rng=np.random.default_rng(self.seed))
+
+    def replay(self):
+        """Replays the trace, yields (game, kind, x, y) before every event and the game after the last one (with kind None)."""
+        game = self.new_game()
+
+        for kind, x, y in self.events:
+            yield game, kind, x, y
+
+            if kind == OPEN or kind == GUESS:
+                game.open(x, y)
+            elif kind == MARK:
+                game.mark(x, y)
+            elif kind == TRIVIAL:
+                game.open_trivials()
+            elif kind == PATTERNS:
+                open_patterns(game, trivials=x == 1)
+
+        yield game, None, 0, 0
+
+    def positions(self):
+        """Yields (snapshot, guessed) of every position the solver was called on, guessed tells whether it had to guess."""
+        pending = None
+
+        for game, kind, _, _ in self.replay():
+            # the proven mines of a solver call are marked first, followed by the safe cells or the guess
+            if pending is not None and kind != MARK:
+                yield pending, kind == GUESS
+                pending = None
+
+            if kind == SOLVE:
+                pending = snapshot(game)
+
+    def to_bytes(self):
+        events = np.array(self.events, dtype=EVENT_DTYPE) if self.events else np.zeros(0, dtype=EVENT_DTYPE)
+
+        return TRACE_HEADER + struct.pack(BOARD_FORMAT, self.seed, self.width, self.height, self.mines) + events.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        assert data[:len(TRACE_HEADER)] == TRACE_HEADER, 'not a game trace'
+        offset = len(TRACE_HEADER) + struct.calcsize(BOARD_FORMAT)
+
+        trace = cls(*struct.unpack(BOARD_FORMAT, data[len(TRACE_HEADER):offset]))
+        trace.events = [tuple(int(value) for value in event) for event in np.frombuffer(data[offset:], dtype=EVENT_DTYPE)]
+
+        return trace
+
+    def save(self, file):
+        with open(file, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, file):
+        with open(file, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+def snapshot(game):
+    """Returns the position of the game (which must have been started) as bit-packed bytes."""
+    assert game.field is not None, 'only started games have a position'
+
+    planes = np.stack([game.field == -1, game.state & EXPLORED != 0, game.state & MARKED != 0])
+
+    return struct.pack('<HHI', game.width, game.height, game.mines) + np.packbits(planes).tobytes()
+
+def restore(data):
+    """Returns a Minesweeper instance in the position of the given snapshot."""
+    width, height, mines = struct.unpack('<HHI', data[:8])
+
+    bits = np.unpackbits(np.frombuffer(data[8:], dtype=np.uint8), count=3 * width * height)
+    is_mine, explored, marked = bits.reshape(3, width, height).astype(bool)
+
+    field = np.where(is_mine, -1, neighbour_sum(is_mine)).astype(np.int8)
+    state = (explored * EXPLORED | marked * MARKED).astype(np.int8)
+
+    game = Minesweeper.__new__(Minesweeper)
+    game.__setstate__({
+        'width': width,
+        'height': height,
+        'mines': mines,
+        'rng': np.random.default_rng(),
+        'field': field,
+        'state': state,
+        'visible': np.where(marked, -3, np.where(explored, field, -2)).astype(np.int8),
+        'open_counter': int(explored.sum()),
+        'marked_counter': int(marked.sum()),
+        'exploded_counter': int((explored & is_mine).sum()),
+        'trivial_counter': 0,
+        'pattern_counter': 0,
+    })
+    game._rebuild_frontier()
+
+    return game
+
+def save_positions(file, snapshots):
+    """Writes the given snapshots to a position file."""
+    with open(file, 'wb') as f:
+        f.write(POSITIONS_HEADER)
+
+        for data in snapshots:
+            f.write(struct.pack('<I', len(data)) + data)
+
+def load_positions(file):
+    """Returns the snapshots of a position file."""
+    with open(file, 'rb') as f:
+        data = f.read()
+
+    assert data[:len(POSITIONS_HEADER)] == POSITIONS_HEADER, f'"{file}" is not a position file'
+
+    snapshots = []
+    offset = len(POSITIONS_HEADER)
+
+    while offset + 4 <= len(data):
+        size, = struct.unpack('<I', data[offset:offset + 4])
+        snapshots.append(data[offset + 4:offset + 4 + size])
+        offset += 4 + size
+
+    return snapshots
@@ -0,0 +1,74 @@
+"""
+Persistent pool of worker processes, used by the grouped solvers to solve independent groups in parallel.
+
+The pool is created on first use and kept for the lifetime of the process, and every worker imports the solver libraries
+the process uses once when it starts, so a task only pays for sending its group over and its result back.
+"""
+
+import importlib
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from profiling import NULL_PROFILER
+
+_pools = {}  # number of workers -> pool
+
+# the modules that can hand groups to the workers
+SOLVER_MODULES = ['solver_clingo_grouped', 'solver_csp_grouped']
+
+
+def _initialize_worker(modules):
+    # importing the solvers (and their native libraries) takes longer than solving most groups
+    for module in modules:
+        importlib.import_module(module)
+
+def get_pool(workers):
+    """Returns the pool with the given number of workers, starting it if needed."""
+    if workers not in _pools:
+        # only the backends the process uses are imported by the workers as well
+        modules = [module for module in SOLVER_MODULES if module in sys.modules]
+        _pools[workers] = ProcessPoolExecutor(max_workers=workers, initializer=_initialize_worker, initargs=(modules,))
+
+    return _pools[workers]
+
+def solve_groups(groups, group_ids, solve_here, worker_task, workers=None, inline_size=12, deadline=None, profile=NULL_PROFILER):
+    """
+        Solves the given groups (ids into groups, a list of (numbers, closed cells)) and returns their results by id.
+        With more than one worker, the groups with at least inline_size closed cells are sent to the workers first, the
+        smaller ones are solved here in the meantime. The time left until the deadline (None for no limit) is shared by them.
+        solve_here(group_id, deadline) solves a group in this process, worker_task(group_id, deadline) returns the function
+        and the arguments a worker calls to solve it.
+    """
+    # big groups are sent to the workers first, the small ones are solved here in the meantime
+    pooled = []
+    if workers is not None and workers > 1:
+        pooled = [group_id for group_id in group_ids if len(groups[group_id][1]) >= inline_size]
+
+    futures = {}
+    for group_id in pooled:
+        # the pooled groups run side by side, so each of them may take a bigger share of the time
+        group_deadline = None if deadline is None else time.time() + max(0, deadline - time.time()) * min(workers, len(pooled)) / len(pooled)
+        futures[group_id] = get_pool(workers).submit(*worker_task(group_id, group_deadline))
+
+    solved = {}
+    inline = [group_id for group_id in group_ids if group_id not in futures]
+    for i, group_id in enumerate(inline):
+        # split the time left evenly among the groups still to solve
+        group_deadline = None if deadline is None else time.time() + max(0, deadline - time.time()) / (len(inline) - i)
+        solved[group_id] = solve_here(group_id, group_deadline)
+
+    # merge the results in the order of the groups, no matter where and when they were solved
+    for group_id in group_ids:
+        if group_id in futures:
+            with profile.phase('workers'):
+                solved[group_id] = futures[group_id].result()
+
+    return {group_id: solved[group_id] for group_id in group_ids}
+
+def shutdown():
+    """Stops all pools."""
+    for pool in _pools.values():
+        pool.shutdown(cancel_futures=True)
+
+    _pools.clear()